@@ -32,6 +32,7 @@ INSTALLED_APPS = [
     'corsheaders',
     'rest_framework_simplejwt.token_blacklist',
     'users.apps.UsersConfig',
+    'market.apps.MarketConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -55,7 +56,7 @@ ROOT_URLCONF = 'bankingapp.urls'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
 }
 
@@ -93,6 +94,31 @@ CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
 CELERY_TIMEZONE = 'Europe/Madrid'
 
+# Caché compartida entre procesos (web y workers de Celery)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv("REDIS_CACHE_URL", "redis://redis:6379/1"),
+    }
+}
+
+# Simulador de precios de mercado
+MARKET_PRICES_URL = os.getenv(
+    "MARKET_PRICES_URL",
+    "https://faas-lon1-917a94a7.doserverless.co/api/v1/web/fn-e0f31110-7521-4cb9-86a2-645f66eefb63/default/market-prices-simulator",
+)
+MARKET_PRICES_TTL = float(os.getenv("MARKET_PRICES_TTL", "1"))              # Segundos que un snapshot local se considera fresco
+MARKET_PRICES_MAX_STALE = float(os.getenv("MARKET_PRICES_MAX_STALE", "60"))  # Segundos que se puede servir un snapshot caducado
+MARKET_PRICES_TIMEOUT = float(os.getenv("MARKET_PRICES_TIMEOUT", "5"))      # Timeout de la petición al simulador
+MARKET_PRICES_REFRESH_INTERVAL = float(os.getenv("MARKET_PRICES_REFRESH_INTERVAL", "2"))  # Cadencia del refresco en Celery beat
+
+# Stream SSE de precios: canal pub/sub de Redis por el que la tarea de refresco difunde cada snapshot,
+# intervalo de keep-alive (segundos) y mensajes pendientes por cliente antes de resincronizarlo
+MARKET_STREAM_REDIS_URL = os.getenv("MARKET_STREAM_REDIS_URL", CACHES['default']['LOCATION'])
+MARKET_STREAM_CHANNEL = os.getenv("MARKET_STREAM_CHANNEL", "market:prices:stream")
+MARKET_STREAM_HEARTBEAT = float(os.getenv("MARKET_STREAM_HEARTBEAT", "15"))
+MARKET_STREAM_QUEUE_SIZE = int(os.getenv("MARKET_STREAM_QUEUE_SIZE", "16"))
+
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
@@ -147,6 +173,15 @@ PASSWORD_HASHERS = [
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Procesos de uvicorn que sirven la API (la imagen fija WEB_CONCURRENCY; runserver usa uno)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Pool de procesos para el hashing de contraseñas y PINs (0 = en el propio hilo de la petición).
+# Cada proceso de uvicorn tiene su propio pool: por defecto los núcleos se reparten entre ellos
+HASHING_POOL_WORKERS = int(os.getenv("HASHING_POOL_WORKERS", str(max((os.cpu_count() or 1) // WEB_CONCURRENCY, 1))))
+HASHING_POOL_MAX_PENDING = int(os.getenv("HASHING_POOL_MAX_PENDING", str(HASHING_POOL_WORKERS * 4 or 1)))  # Operaciones en cola o en curso antes de devolver 503
+HASHING_RETRY_AFTER = int(os.getenv("HASHING_RETRY_AFTER", "1"))  # Segundos indicados en Retry-After
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -169,7 +204,44 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Velas OHLC devueltas como máximo por cada consulta del histórico de precios
+MARKET_HISTORY_MAX_BARS = int(os.getenv("MARKET_HISTORY_MAX_BARS", "1000"))
+
+# Ventana durante la que se agrupan los disparos repetidos de una misma tarea
+TASK_DEBOUNCE_SECONDS = int(os.getenv("TASK_DEBOUNCE_SECONDS", "5"))
+
+# Números de cuenta que cada proceso reserva de golpe del pool pregenerado
+ACCOUNT_NUMBER_BLOCK_SIZE = int(os.getenv("ACCOUNT_NUMBER_BLOCK_SIZE", "100"))
+
+# Caché de usuarios autenticados: entradas del LRU local por proceso y caducidad en Redis (segundos)
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "1024"))
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv("AUTH_USER_CACHE_TIMEOUT", "300"))
+
+# Tokens de step-up: validez en segundos y número máximo de operaciones por token
+STEP_UP_TOKEN_TTL = int(os.getenv("STEP_UP_TOKEN_TTL", "300"))
+STEP_UP_TOKEN_MAX_USES = int(os.getenv("STEP_UP_TOKEN_MAX_USES", "100"))
+
+# Transferencias masivas: máximo de tramos por petición, tramos por transacción,
+# a partir de cuántos tramos se procesan en segundo plano con Celery y durante cuántos segundos
+# se puede consultar el estado de un lote en segundo plano
+BULK_TRANSFER_MAX_LEGS = int(os.getenv("BULK_TRANSFER_MAX_LEGS", "50000"))
+BULK_TRANSFER_CHUNK_SIZE = int(os.getenv("BULK_TRANSFER_CHUNK_SIZE", "500"))
+BULK_TRANSFER_SYNC_LIMIT = int(os.getenv("BULK_TRANSFER_SYNC_LIMIT", "1000"))
+BULK_TRANSFER_STATUS_TTL = int(os.getenv("BULK_TRANSFER_STATUS_TTL", "86400"))
+
+# Número de shards en los que se reparte cada ejecución del bot de auto-inversión
+AUTO_INVEST_SHARDS = int(os.getenv("AUTO_INVEST_SHARDS", "8"))
+
+# Outbox de correos: mensajes por lote y conexión SMTP, reintentos máximos y espera base entre reintentos (segundos)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_BACKOFF = int(os.getenv("OUTBOX_RETRY_BACKOFF", "30"))
+
 CELERY_BEAT_SCHEDULE = {
+    'refresh_market_prices': {
+        'task': 'market.tasks.refresh_market_prices',
+        'schedule': timedelta(seconds=MARKET_PRICES_REFRESH_INTERVAL),  # Publica el snapshot de precios en Redis
+    },
     'process_subscriptions': {
         'task': 'users.tasks.process_subscriptions',
         'schedule': crontab(minute='*/1'),  # Ejecuta cada minuto
@@ -178,4 +250,8 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'users.tasks.auto_invest_bot',
         'schedule': timedelta(seconds=30),  # Ejecuta cada 30 segundos
     },
+    'deliver_outbox': {
+        'task': 'users.tasks.deliver_outbox',
+        'schedule': timedelta(seconds=30),  # Recoge reintentos y correos cuyo aviso se haya perdido
+    },
 }
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Histórico de precios de mercado.
+
+Cada snapshot publicado se guarda como ticks en `PriceTick` y se agrega en el momento a velas OHLC
+de 1 minuto, 1 hora y 1 día (`PriceBar`). Las consultas de gráficos solo leen velas, así que su
+coste depende del número de velas devueltas y no del número de ticks.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import PriceBar, PriceTick
+
+# Duración de cada intervalo en segundos
+INTERVALS = {"1m": 60, "1h": 3600, "1d": 86400}
+
+
+class PriceHistoryQueryError(ValueError):
+    """Parámetros de consulta del histórico inválidos."""
+
+
+def bucket_start(moment, interval):
+    """Inicio del intervalo (alineado a epoch en UTC) que contiene `moment`."""
+    seconds = INTERVALS[interval]
+    timestamp = int(moment.timestamp())
+    return datetime.fromtimestamp(timestamp - timestamp % seconds, tz=dt_timezone.utc)
+
+
+def record_snapshot(snapshot):
+    """Guarda los precios de un snapshot como ticks y actualiza sus velas."""
+    recorded_at = datetime.fromtimestamp(snapshot["timestamp"], tz=dt_timezone.utc)
+    prices = {symbol: Decimal(str(price)) for symbol, price in snapshot["prices"].items()}
+    if not prices:
+        return
+
+    PriceTick.objects.bulk_create([
+        PriceTick(symbol=symbol, price=price, recorded_at=recorded_at, version=snapshot["version"])
+        for symbol, price in prices.items()
+    ])
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                for interval in INTERVALS:
+                    _roll_up(prices, interval, bucket_start(recorded_at, interval))
+            return
+        except IntegrityError:
+            # Otra ejecución ha creado la misma vela a la vez: al reintentar se bloquea y se actualiza la suya
+            if attempt:
+                raise
+
+
+def _roll_up(prices, interval, start):
+    bars = {
+        bar.symbol: bar
+        for bar in PriceBar.objects.select_for_update()
+        .filter(interval=interval, bucket_start=start, symbol__in=list(prices))
+    }
+    new_bars = []
+    for symbol, price in prices.items():
+        bar = bars.get(symbol)
+        if bar is None:
+            new_bars.append(PriceBar(
+                symbol=symbol, interval=interval, bucket_start=start,
+                open=price, high=price, low=price, close=price, count=1,
+            ))
+            continue
+        bar.high = max(bar.high, price)
+        bar.low = min(bar.low, price)
+        bar.close = price
+        bar.count += 1
+
+    if bars:
+        PriceBar.objects.bulk_update(bars.values(), ["high", "low", "close", "count"])
+    if new_bars:
+        PriceBar.objects.bulk_create(new_bars)
+
+
+def _parse_timestamp(value, name):
+    # Milisegundos desde epoch, igual que el historial de transacciones
+    try:
+        return datetime.fromtimestamp(int(value) / 1000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise PriceHistoryQueryError(f"Invalid '{name}' timestamp")
+
+
+def query_bars(symbol, params):
+    """
+    Velas de `symbol` a partir de los parámetros:
+    - interval: 1m, 1h (por defecto) o 1d
+    - from / to: rango en milisegundos desde epoch (to excluido); por defecto las últimas velas hasta ahora
+    Devuelve (velas, siguiente `from` o None): como mucho MARKET_HISTORY_MAX_BARS velas, de la más antigua
+    a la más reciente. Si el rango tiene más, el siguiente `from` (ms) es el inicio de la primera vela no devuelta.
+    """
+    interval = params.get("interval", "1h")
+    if interval not in INTERVALS:
+        raise PriceHistoryQueryError(f"Invalid 'interval', expected any of {', '.join(INTERVALS)}")
+
+    max_bars = settings.MARKET_HISTORY_MAX_BARS
+    end = _parse_timestamp(params["to"], "to") if params.get("to") else datetime.now(dt_timezone.utc)
+    if params.get("from"):
+        start = _parse_timestamp(params["from"], "from")
+    else:
+        start = end - timedelta(seconds=INTERVALS[interval] * max_bars)
+    if start >= end:
+        raise PriceHistoryQueryError("'from' must be earlier than 'to'")
+
+    bars = list(
+        PriceBar.objects.filter(symbol=symbol, interval=interval, bucket_start__gte=start, bucket_start__lt=end)
+        .order_by("bucket_start")
+        .values_list("bucket_start", "open", "high", "low", "close", "count")[:max_bars + 1]
+    )
+    if len(bars) > max_bars:
+        return bars[:max_bars], int(bars[max_bars][0].timestamp() * 1000)
+    return bars, None
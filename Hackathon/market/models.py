@@ -1,3 +1,44 @@
 from django.db import models
 
-# Create your models here.
+
+class PriceTick(models.Model):
+    """Precio de un activo en un snapshot publicado. Tabla de solo inserción."""
+    symbol = models.CharField(max_length=10)
+    price = models.DecimalField(max_digits=20, decimal_places=8)
+    recorded_at = models.DateTimeField()
+    version = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['symbol', 'recorded_at'], name='pricetick_symbol_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.price} at {self.recorded_at}"
+
+
+class PriceBar(models.Model):
+    """Vela OHLC de un activo agregada a partir de los ticks de un intervalo."""
+    INTERVALS = [
+        ("1m", "1 minute"),
+        ("1h", "1 hour"),
+        ("1d", "1 day"),
+    ]
+
+    symbol = models.CharField(max_length=10)
+    interval = models.CharField(choices=INTERVALS, max_length=2)
+    bucket_start = models.DateTimeField()
+    open = models.DecimalField(max_digits=20, decimal_places=8)
+    high = models.DecimalField(max_digits=20, decimal_places=8)
+    low = models.DecimalField(max_digits=20, decimal_places=8)
+    close = models.DecimalField(max_digits=20, decimal_places=8)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # También es el índice de las consultas por rango (symbol, interval, bucket_start)
+            models.UniqueConstraint(fields=['symbol', 'interval', 'bucket_start'], name='pricebar_bucket_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol} {self.interval} bar at {self.bucket_start}"
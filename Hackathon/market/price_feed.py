@@ -0,0 +1,136 @@
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+SNAPSHOT_KEY = "market:prices:snapshot"
+SEQUENCE_KEY = "market:prices:seq"
+
+
+class PriceFeedError(Exception):
+    """No se ha podido obtener ningún snapshot de precios de mercado."""
+
+
+class PriceFeed:
+    """
+    Snapshot de precios compartido por todo el proceso.
+
+    La fuente principal es el snapshot versionado que la tarea `refresh_market_prices`
+    publica en Redis; solo si no existe o es demasiado antiguo se consulta el simulador.
+
+    - Mientras el snapshot local tenga menos de `ttl` segundos se sirve desde memoria.
+    - Si ha caducado pero tiene menos de `max_stale` segundos, se devuelve el snapshot
+      antiguo y se refresca en segundo plano (stale-while-revalidate).
+    - Solo un hilo refresca a la vez (single-flight); el resto espera
+      o reutiliza el snapshot existente.
+    """
+
+    def __init__(self, url, ttl, max_stale, timeout):
+        self.url = url
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.timeout = timeout
+        self._snapshot = None
+        self._fetched_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def get_snapshot(self):
+        """Devuelve el snapshot actual: {"version", "timestamp", "prices"}."""
+        snapshot = self._snapshot
+        age = time.monotonic() - self._fetched_at
+
+        if snapshot is not None and age < self.ttl:
+            return snapshot
+
+        if snapshot is not None and age < self.max_stale:
+            # Servimos el dato antiguo y refrescamos en segundo plano si nadie lo está haciendo ya
+            if self._refresh_lock.acquire(blocking=False):
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+            return snapshot
+
+        # Sin snapshot utilizable: esperamos a la única petición en curso
+        with self._refresh_lock:
+            if self._snapshot is None or time.monotonic() - self._fetched_at >= self.max_stale:
+                self._refresh()
+            return self._snapshot
+
+    def get_prices(self):
+        """Devuelve el diccionario {símbolo: precio}. No debe modificarse."""
+        return self.get_snapshot()["prices"]
+
+    def get_price(self, asset_symbol):
+        """Devuelve el precio del símbolo o None si el mercado no lo publica."""
+        return self.get_prices().get(asset_symbol)
+
+    def invalidate(self):
+        """Fuerza una nueva lectura en la próxima consulta."""
+        self._snapshot = None
+        self._fetched_at = 0.0
+
+    def fetch_upstream(self):
+        """Consulta el simulador de precios y devuelve {símbolo: precio}."""
+        try:
+            response = requests.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            prices = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise PriceFeedError(f"Error al conectar con la API de precios: {e}") from e
+
+        if not isinstance(prices, dict):
+            raise PriceFeedError("Respuesta inesperada de la API de precios.")
+        return prices
+
+    def latest_published(self):
+        """Último snapshot publicado en Redis, o None si no hay ninguno."""
+        return cache.get(SNAPSHOT_KEY)
+
+    def publish(self, prices):
+        """Guarda en Redis un nuevo snapshot versionado y lo devuelve."""
+        cache.add(SEQUENCE_KEY, 0, timeout=None)
+        snapshot = {
+            "version": cache.incr(SEQUENCE_KEY),
+            "timestamp": time.time(),
+            "prices": prices,
+        }
+        cache.set(SNAPSHOT_KEY, snapshot, timeout=None)
+        return snapshot
+
+    def _refresh_in_background(self):
+        try:
+            self._refresh()
+        except PriceFeedError as e:
+            print(f"Error al refrescar los precios de mercado: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self):
+        self._snapshot = self._load()
+        self._fetched_at = time.monotonic()
+
+    def _load(self):
+        try:
+            snapshot = cache.get(SNAPSHOT_KEY)
+        except Exception as e:
+            print(f"Error al leer el snapshot de precios de Redis: {e}")
+            snapshot = None
+
+        if snapshot is not None and time.time() - snapshot["timestamp"] < self.max_stale:
+            return snapshot
+
+        # El refresco periódico no está publicando: consultamos el simulador directamente
+        prices = self.fetch_upstream()
+        try:
+            return self.publish(prices)
+        except Exception as e:
+            print(f"Error al publicar el snapshot de precios en Redis: {e}")
+            return {"version": 0, "timestamp": time.time(), "prices": prices}
+
+
+price_feed = PriceFeed(
+    url=settings.MARKET_PRICES_URL,
+    ttl=settings.MARKET_PRICES_TTL,
+    max_stale=settings.MARKET_PRICES_MAX_STALE,
+    timeout=settings.MARKET_PRICES_TIMEOUT,
+)
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Se emite tras publicar un snapshot de precios. Argumentos: `snapshot` y `changed` (símbolos cuyo precio ha cambiado)
+prices_published = Signal()
@@ -0,0 +1,104 @@
+"""
+Difusión de precios en tiempo real (Server-Sent Events).
+
+La tarea `refresh_market_prices` es el único poller del simulador: publica cada snapshot en un canal
+pub/sub de Redis. Cada proceso ASGI mantiene una sola suscripción a ese canal y reparte a sus clientes
+conectados únicamente los símbolos cuyo precio ha cambiado. Los clientes son corrutinas en espera,
+no hilos, así que miles de conexiones inactivas apenas consumen recursos.
+"""
+import asyncio
+import json
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+
+_publisher = None
+
+
+def publish_snapshot(snapshot):
+    """Difunde un snapshot publicado a todos los procesos suscritos al canal."""
+    global _publisher
+    if _publisher is None:
+        _publisher = redis.Redis.from_url(settings.MARKET_STREAM_REDIS_URL)
+    try:
+        _publisher.publish(settings.MARKET_STREAM_CHANNEL, json.dumps(snapshot))
+    except redis.RedisError as e:
+        print(f"Error al difundir el snapshot de precios: {e}")
+
+
+class PriceBroadcaster:
+    """
+    Suscripción a Redis compartida por todos los clientes SSE de un proceso.
+
+    Guarda los últimos precios recibidos, calcula una sola vez por snapshot qué símbolos han
+    cambiado y deja el diff en la cola de cada cliente. Si un cliente lento llena su cola se
+    vacía y recibe después el snapshot completo, así nunca se acumula memoria por él.
+    """
+
+    def __init__(self, url, channel, queue_size):
+        self.url = url
+        self.channel = channel
+        self.queue_size = queue_size
+        self.version = None
+        self.prices = {}
+        self._clients = set()
+        self._listener = None
+
+    def subscribe(self):
+        """Registra un cliente y devuelve su cola; arranca la suscripción a Redis si no está activa."""
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._clients.discard(queue)
+
+    async def _listen(self):
+        delay = 1
+        while True:
+            try:
+                client = aioredis.Redis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    delay = 1
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._dispatch(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Suscripción a precios en tiempo real interrumpida: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _dispatch(self, snapshot):
+        prices = snapshot["prices"]
+        changed = {symbol: price for symbol, price in prices.items() if self.prices.get(symbol) != price}
+        self.version = snapshot["version"]
+        self.prices = prices
+        if not changed:
+            return
+
+        event = ("prices", self.version, changed)
+        for queue in self._clients:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Cliente lento: descartamos sus diffs pendientes y lo resincronizamos con todo el snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("snapshot", self.version, self.prices))
+
+
+def format_event(event, version, data):
+    return f"event: {event}\nid: {version}\ndata: {json.dumps(data)}\n\n"
+
+
+broadcaster = PriceBroadcaster(
+    url=settings.MARKET_STREAM_REDIS_URL,
+    channel=settings.MARKET_STREAM_CHANNEL,
+    queue_size=settings.MARKET_STREAM_QUEUE_SIZE,
+)
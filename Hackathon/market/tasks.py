@@ -0,0 +1,24 @@
+from celery import shared_task
+from .history import record_snapshot
+from .price_feed import PriceFeed, PriceFeedError, price_feed
+from .signals import prices_published
+from .stream import publish_snapshot
+
+@shared_task(ignore_result=True)
+def refresh_market_prices():
+    """Consulta el simulador de precios, publica un nuevo snapshot versionado en Redis y lo guarda en el histórico."""
+    try:
+        prices = price_feed.fetch_upstream()
+    except PriceFeedError as e:
+        print(f"Error al refrescar los precios de mercado: {e}")
+        return None
+
+    previous = (price_feed.latest_published() or {}).get("prices", {})
+    snapshot = price_feed.publish(prices)
+    publish_snapshot(snapshot)
+    record_snapshot(snapshot)
+
+    changed = {symbol for symbol, price in prices.items() if previous.get(symbol) != price}
+    if changed:
+        prices_published.send(sender=PriceFeed, snapshot=snapshot, changed=changed)
+    return snapshot["version"]
@@ -1,3 +1,69 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from .history import record_snapshot
+from .models import PriceBar
 
-# Create your tests here.
+
+def epoch_ms(moment):
+    return int(moment.timestamp() * 1000)
+
+
+class PriceHistoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.start = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        for minute, price in enumerate([10, 20, 30]):
+            record_snapshot({
+                "version": minute + 1,
+                "timestamp": self.start.timestamp() + minute * 60,
+                "prices": {"GOLD": price},
+            })
+
+    def get_history(self, **params):
+        return self.client.get("/market/prices/GOLD/history", {"interval": "1m", **params})
+
+    def test_snapshots_roll_up_into_bars(self):
+        hour = PriceBar.objects.get(symbol="GOLD", interval="1h")
+        self.assertEqual(
+            (hour.open, hour.high, hour.low, hour.close, hour.count),
+            (Decimal("10"), Decimal("30"), Decimal("10"), Decimal("30"), 3),
+        )
+        self.assertEqual(PriceBar.objects.filter(symbol="GOLD", interval="1m").count(), 3)
+
+    def test_tick_is_rolled_up_after_a_concurrent_bar_insert(self):
+        create_bars = PriceBar.objects.bulk_create
+        calls = []
+
+        def conflicting_create(bars):
+            # La primera inserción choca con la vela que otra ejecución acaba de crear
+            calls.append(bars)
+            if len(calls) == 1:
+                raise IntegrityError("pricebar_bucket_unique")
+            return create_bars(bars)
+
+        with mock.patch.object(PriceBar.objects, "bulk_create", side_effect=conflicting_create):
+            record_snapshot({"version": 4, "timestamp": self.start.timestamp() + 3600, "prices": {"GOLD": 40}})
+
+        # Vela de 1m rechazada y, al reintentar, las nuevas de 1m y 1h; la de 1d ya existía y se actualiza
+        self.assertEqual(len(calls), 3)
+        for interval in ("1m", "1h"):
+            bar = PriceBar.objects.get(symbol="GOLD", interval=interval, bucket_start=self.start + timedelta(hours=1))
+            self.assertEqual((bar.close, bar.count), (Decimal("40"), 1))
+        day = PriceBar.objects.get(symbol="GOLD", interval="1d")
+        self.assertEqual((day.close, day.count), (Decimal("40"), 4))
+
+    @override_settings(MARKET_HISTORY_MAX_BARS=2)
+    def test_ranges_beyond_the_cap_are_paged(self):
+        end = epoch_ms(self.start) + 3600 * 1000
+        response = self.get_history(**{"from": epoch_ms(self.start), "to": end})
+
+        self.assertEqual([bar["close"] for bar in response.data["bars"]], [10.0, 20.0])
+        self.assertEqual(response.data["nextFrom"], epoch_ms(self.start) + 120 * 1000)
+
+        response = self.get_history(**{"from": response.data["nextFrom"], "to": end})
+        self.assertEqual([bar["close"] for bar in response.data["bars"]], [30.0])
+        self.assertIsNone(response.data["nextFrom"])
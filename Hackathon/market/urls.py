@@ -1,7 +1,9 @@
 from django.urls import path
-from .views import AllMarketPricesView, IndividualMarketPriceView
+from .views import AllMarketPricesView, IndividualMarketPriceView, MarketPriceHistoryView, market_price_stream
 
 urlpatterns = [
     path('prices', AllMarketPricesView.as_view(), name='all-market-prices'),
+    path('prices/stream', market_price_stream, name='market-price-stream'),
     path('prices/<str:asset_symbol>', IndividualMarketPriceView.as_view(), name='individual-market-price'),
+    path('prices/<str:asset_symbol>/history', MarketPriceHistoryView.as_view(), name='market-price-history'),
 ]
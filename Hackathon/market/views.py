@@ -1,32 +1,89 @@
-import requests
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from .history import PriceHistoryQueryError, query_bars
+from .price_feed import price_feed, PriceFeedError
+from .stream import broadcaster, format_event
 
 class AllMarketPricesView(APIView):
     def get(self, request):
         try:
-            # Realizar solicitud al endpoint de precios de mercado
-            response = requests.get("https://faas-lon1-917a94a7.doserverless.co/api/v1/web/fn-e0f31110-7521-4cb9-86a2-645f66eefb63/default/market-prices-simulator")
-            response.raise_for_status()  # Verificar si la solicitud fue exitosa
-            market_prices = response.json()
+            # Leer el snapshot compartido de precios de mercado
+            market_prices = price_feed.get_prices()
             return Response(market_prices, status=status.HTTP_200_OK)
-        except requests.RequestException:
+        except PriceFeedError:
             return Response({"detail": "Error retrieving market prices"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 class IndividualMarketPriceView(APIView):
     def get(self, request, asset_symbol):
         try:
-            # Realizar solicitud al endpoint de precios de mercado
-            response = requests.get("https://faas-lon1-917a94a7.doserverless.co/api/v1/web/fn-e0f31110-7521-4cb9-86a2-645f66eefb63/default/market-prices-simulator")
-            response.raise_for_status()
-            market_prices = response.json()
+            # Leer el snapshot compartido de precios de mercado
+            market_prices = price_feed.get_prices()
 
             # Verificar si el símbolo del activo está en los datos de mercado
             if asset_symbol in market_prices:
                 return Response({asset_symbol: market_prices[asset_symbol]}, status=status.HTTP_200_OK)
             else:
                 return Response({"detail": f"Price for asset {asset_symbol} not found"}, status=status.HTTP_404_NOT_FOUND)
-        except requests.RequestException:
+        except PriceFeedError:
             return Response({"detail": "Error retrieving market prices"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class MarketPriceHistoryView(APIView):
+    def get(self, request, asset_symbol):
+        # Velas OHLC del activo servidas desde las agregaciones, nunca desde los ticks
+        try:
+            bars, next_from = query_bars(asset_symbol, request.query_params)
+        except PriceHistoryQueryError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "symbol": asset_symbol,
+            "interval": request.query_params.get("interval", "1h"),
+            "bars": [
+                {
+                    "timestamp": int(start.timestamp() * 1000),
+                    "open": float(open_), "high": float(high), "low": float(low), "close": float(close),
+                    "count": count,
+                }
+                for start, open_, high, low, close, count in bars
+            ],
+            # Rango con más velas que el máximo: se piden las siguientes con from=nextFrom y el mismo 'to'
+            "nextFrom": next_from,
+        }, status=status.HTTP_200_OK)
+
+
+async def market_price_stream(request):
+    """
+    Stream SSE de precios: un evento `snapshot` con todos los precios al conectar y después
+    eventos `prices` solo con los símbolos que cambian. Debe servirse con ASGI.
+    """
+    queue = broadcaster.subscribe()
+    try:
+        snapshot = await sync_to_async(price_feed.get_snapshot)()
+    except PriceFeedError:
+        snapshot = {"version": broadcaster.version, "prices": broadcaster.prices}
+
+    async def events():
+        try:
+            yield format_event("snapshot", snapshot["version"], snapshot["prices"])
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=settings.MARKET_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # Comentario SSE para que proxies y clientes no cierren la conexión inactiva
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(*event)
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
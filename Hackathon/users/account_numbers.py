@@ -0,0 +1,87 @@
+import threading
+import uuid
+from collections import deque
+from django.conf import settings
+from django.db import transaction
+from .models import AccountNumberPool, CustomUser
+
+_numbers = deque()
+_lock = threading.Lock()
+
+# Números de cuenta posibles: 6 caracteres hexadecimales
+KEYSPACE = 16 ** 6
+
+
+class PoolExhausted(Exception):
+    """No quedan números de cuenta sin usar suficientes para llenar el pool."""
+
+
+def claim_block(size):
+    """
+    Reserva para este proceso un bloque de números libres del pool (estilo hi/lo).
+    Los números reservados no vuelven al pool aunque el proceso termine sin usarlos.
+    """
+    with transaction.atomic():
+        block = list(
+            AccountNumberPool.objects.select_for_update(skip_locked=True)
+            .filter(claimed=False)
+            .order_by("id")
+            .values_list("id", "number")[:size]
+        )
+        if block:
+            AccountNumberPool.objects.filter(id__in=[pk for pk, _ in block]).update(claimed=True)
+    return [number for _, number in block]
+
+
+def allocate_account_number():
+    """Devuelve un número de cuenta libre sin consultar la tabla de usuarios."""
+    with _lock:
+        if not _numbers:
+            _numbers.extend(claim_block(settings.ACCOUNT_NUMBER_BLOCK_SIZE))
+        if _numbers:
+            return _numbers.popleft()
+
+    # Pool agotado: se vuelve a generar números aleatorios comprobando que no existan
+    # ni estén en el pool, donde otro proceso podría reservarlos después
+    print("Pool de números de cuenta agotado, ejecuta 'manage.py refill_account_numbers'")
+    while True:
+        # Genera un número de cuenta de 6 caracteres único
+        new_account_number = uuid.uuid4().hex[:6]
+        if (
+            not CustomUser.objects.filter(accountNumber=new_account_number).exists()
+            and not AccountNumberPool.objects.filter(number=new_account_number).exists()
+        ):
+            return new_account_number
+
+
+def refill_pool(target_free, batch_size=10000, max_idle_batches=5):
+    """
+    Genera números aleatorios nuevos hasta que el pool tenga `target_free` libres.
+    Se descartan los que ya estén en el pool o asignados a un usuario. Devuelve cuántos se han añadido.
+    Lanza PoolExhausted si el espacio de números no alcanza o si `max_idle_batches` lotes seguidos
+    no añaden ninguno.
+    """
+    free = AccountNumberPool.objects.filter(claimed=False).count()
+    if target_free > free:
+        used = AccountNumberPool.objects.count() + CustomUser.objects.exclude(
+            accountNumber__in=AccountNumberPool.objects.values("number")
+        ).count()
+        if target_free - free > KEYSPACE - used:
+            raise PoolExhausted(f"Only {KEYSPACE - used} unused account numbers left, {target_free - free} requested")
+
+    initial = free
+    idle_batches = 0
+    while free < target_free:
+        candidates = {uuid.uuid4().hex[:6] for _ in range(min(target_free - free, batch_size))}
+        candidates -= set(AccountNumberPool.objects.filter(number__in=candidates).values_list("number", flat=True))
+        candidates -= set(CustomUser.objects.filter(accountNumber__in=candidates).values_list("accountNumber", flat=True))
+        AccountNumberPool.objects.bulk_create(
+            [AccountNumberPool(number=number) for number in candidates], ignore_conflicts=True
+        )
+
+        # bulk_create devuelve también las filas ignoradas por conflicto: se vuelve a contar
+        previous, free = free, AccountNumberPool.objects.filter(claimed=False).count()
+        idle_batches = idle_batches + 1 if free <= previous else 0
+        if idle_batches >= max_idle_batches:
+            raise PoolExhausted(f"No new account numbers after {max_idle_batches} batches, {free} free")
+    return max(free - initial, 0)
@@ -0,0 +1,163 @@
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Mod
+from django.utils import timezone
+from market.price_feed import price_feed
+from . import ledger
+from .models import AutoInvest, Transaction, UserAsset
+
+# Fracción de la posición que el bot compra o vende cuando se dispara una regla
+TRADE_FRACTION = Decimal('0.1')
+
+# Usuarios procesados por cada transacción de base de datos
+CHUNK_SIZE = 500
+
+
+def load_prices():
+    """Obtiene una sola vez el snapshot de precios y lo convierte a Decimal."""
+    prices = {}
+    for symbol, price in price_feed.get_prices().items():
+        try:
+            prices[symbol] = Decimal(str(price))
+        except InvalidOperation:
+            print(f"Precio inválido para el activo {symbol}: {price}")
+    return prices
+
+
+def plan_trades(account, assets, prices, now):
+    """
+    Calcula en memoria las operaciones de un usuario aplicando las reglas del bot.
+    Actualiza el balance de `account` y la cantidad de cada activo afectado, y devuelve
+    (activos modificados, transacciones a registrar).
+    """
+    changed_assets = []
+    transactions = []
+
+    for asset in assets:
+        current_price = prices.get(asset.assetSymbol)
+        if current_price is None:
+            continue
+
+        # Condición de compra: Si el precio cae un 20% por debajo del precio de compra original
+        if current_price < asset.buy_trigger_price:
+            amount_to_buy = asset.quantity * TRADE_FRACTION
+            total_cost = amount_to_buy * current_price
+            if account.balance >= total_cost:
+                asset.quantity += amount_to_buy
+                account.balance -= total_cost
+                changed_assets.append(asset)
+                transactions.append(Transaction(
+                    amount=total_cost,
+                    transactionType="ASSET_PURCHASE",
+                    sourceAccount=account,
+                    transactionDate=now,
+                ))
+
+        # Condición de venta: Si el precio sube un 20% por encima del precio de compra original
+        elif current_price > asset.sell_trigger_price:
+            amount_to_sell = asset.quantity * TRADE_FRACTION
+            total_revenue = amount_to_sell * current_price
+            if amount_to_sell > 0:
+                asset.quantity -= amount_to_sell
+                account.balance += total_revenue
+                changed_assets.append(asset)
+                transactions.append(Transaction(
+                    amount=total_revenue,
+                    transactionType="ASSET_SELL",
+                    sourceAccount=account,
+                    transactionDate=now,
+                ))
+
+    return changed_assets, transactions
+
+
+def run_auto_invest(user_ids, prices, run_started=None):
+    """
+    Aplica las reglas del bot a los usuarios indicados en bloques de CHUNK_SIZE.
+    Cada bloque bloquea sus filas, carga cuentas y activos en pocas consultas y guarda
+    los cambios con bulk_update/bulk_create dentro de una única transacción.
+
+    Los usuarios ya procesados por una ejecución iniciada en `run_started` o después
+    (o bloqueados por otra ejecución en curso) se omiten, evitando operar dos veces.
+    """
+    run_started = run_started or timezone.now()
+    summary = {"users": 0, "trades": 0, "failures": 0}
+
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        chunk = user_ids[start:start + CHUNK_SIZE]
+        try:
+            with transaction.atomic():
+                chunk_summary = _process_chunk(chunk, prices, run_started)
+        except Exception as e:
+            print(f"Error inesperado al procesar el bloque de auto-inversión {chunk[0]}-{chunk[-1]}: {e}")
+            summary["failures"] += len(chunk)
+            continue
+        summary["users"] += chunk_summary["users"]
+        summary["trades"] += chunk_summary["trades"]
+
+    return summary
+
+
+def _process_chunk(user_ids, prices, run_started):
+    # Bloqueamos los bots del bloque; los que otra ejecución tenga bloqueados o ya haya procesado se omiten
+    locked_user_ids = list(
+        AutoInvest.objects.select_for_update(skip_locked=True)
+        .filter(user_id__in=user_ids, is_active=True)
+        .filter(Q(last_executed__isnull=True) | Q(last_executed__lt=run_started))
+        .values_list("user_id", flat=True)
+    )
+    if not locked_user_ids:
+        return {"users": 0, "trades": 0}
+
+    accounts = ledger.lock_accounts(locked_user_ids)
+    assets_by_user = {}
+    triggered_assets = UserAsset.objects.filter(triggered_q(prices), user_id__in=locked_user_ids)
+    for asset in triggered_assets.order_by("user_id", "id"):
+        assets_by_user.setdefault(asset.user_id, []).append(asset)
+
+    changed_assets = []
+    changed_accounts = []
+    transactions = []
+    for user_id, assets in assets_by_user.items():
+        account = accounts.get(user_id)
+        if account is None:
+            continue
+        user_assets, user_transactions = plan_trades(account, assets, prices, run_started)
+        if user_transactions:
+            changed_assets.extend(user_assets)
+            changed_accounts.append(account)
+            transactions.extend(user_transactions)
+
+    if changed_assets:
+        UserAsset.objects.bulk_update(changed_assets, ["quantity"])
+        ledger.settle_batch(changed_accounts, transactions)
+
+    # Registrar la última ejecución del bot para estos usuarios
+    AutoInvest.objects.filter(user_id__in=locked_user_ids).update(last_executed=run_started)
+
+    return {"users": len(locked_user_ids), "trades": len(transactions)}
+
+
+def triggered_q(prices):
+    """
+    Condición que selecciona los activos cuyo precio de disparo se ha cruzado con los precios actuales.
+    Cada símbolo se resuelve como un rango sobre los índices (assetSymbol, *_trigger_price).
+    Las posiciones vacías se excluyen: el bot no puede operar con ellas y se seleccionarían en cada ejecución.
+    """
+    condition = Q(pk__in=[])
+    for symbol, price in prices.items():
+        condition |= Q(assetSymbol=symbol, buy_trigger_price__gt=price)
+        condition |= Q(assetSymbol=symbol, sell_trigger_price__lt=price)
+    return condition & Q(quantity__gt=0)
+
+
+def triggered_user_ids(prices, shard=None, shard_count=None):
+    """
+    Ids de los usuarios con auto-inversión activa que tienen algún activo cuyo disparo se ha cruzado,
+    ordenados; opcionalmente solo los de un shard.
+    """
+    queryset = UserAsset.objects.filter(triggered_q(prices), user__autoinvest__is_active=True)
+    if shard_count:
+        queryset = queryset.annotate(shard=Mod("user_id", shard_count)).filter(shard=shard)
+    return list(queryset.order_by("user_id").values_list("user_id", flat=True).distinct())
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.cache import cache
+from .tasks import auto_invest_user, deliver_outbox
+
+
+def _coalesce(key, task, args=(), countdown=0):
+    """
+    Encola `task` solo si no hay ya una ejecución pendiente con la misma clave.
+    La clave de deduplicación vive en Redis durante la ventana de debounce.
+    Devuelve True si se ha encolado la tarea.
+    """
+    window = settings.TASK_DEBOUNCE_SECONDS
+    if not cache.add(f"dispatch:{key}", 1, timeout=window):
+        return False
+    task.apply_async(args=args, countdown=countdown)
+    return True
+
+
+def trigger_user_auto_invest(user_id):
+    """Evalúa cuanto antes los activos de un único usuario."""
+    return _coalesce(f"auto_invest_user:{user_id}", auto_invest_user, args=(user_id,))
+
+
+def trigger_outbox_delivery():
+    """Programa el envío del outbox; los correos encolados durante la ventana de debounce viajan en el mismo lote."""
+    return _coalesce("deliver_outbox", deliver_outbox, countdown=settings.TASK_DEBOUNCE_SECONDS)
@@ -0,0 +1,93 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+
+class HashingUnavailable(APIException):
+    """El pool de hashing está saturado; el cliente debe reintentar más tarde."""
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Server busy, please retry later."
+    default_code = "hashing_unavailable"
+
+    def __init__(self, wait):
+        super().__init__()
+        # DRF convierte `wait` en la cabecera Retry-After
+        self.wait = wait
+
+
+def init_worker():
+    """Inicializa Django en cada proceso de un pool de hashing."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "bankingapp.settings")
+    import django
+    django.setup()
+
+
+def _timed(func, *args):
+    started = time.time()
+    result = func(*args)
+    return result, started, time.time() - started
+
+
+class HashingPool:
+    """
+    Ejecuta el hashing de contraseñas y PINs (bcrypt/PBKDF2) en un pool de procesos dedicado,
+    para que una ráfaga de logins no bloquee los hilos que atienden el resto de endpoints.
+
+    Como mucho `max_pending` operaciones pueden estar en cola o en curso; por encima se rechaza
+    la petición con 503 y Retry-After en lugar de acumular latencia.
+    """
+
+    def __init__(self, workers, max_pending, retry_after):
+        self.workers = workers
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def make_password(self, raw_password):
+        return self._run(hashers.make_password, raw_password)
+
+    def check_password(self, raw_password, encoded):
+        if not raw_password or not encoded:
+            return False
+        return self._run(hashers.check_password, raw_password, encoded)
+
+    def _get_executor(self):
+        # Se crea en el primer uso para que cada proceso de uvicorn/runserver tenga su propio pool
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+
+        if not self._slots.acquire(blocking=False):
+            logger.warning("Pool de hashing saturado, petición rechazada")
+            raise HashingUnavailable(self.retry_after)
+
+        submitted = time.time()
+        try:
+            result, started, hash_time = self._get_executor().submit(_timed, func, *args).result()
+        finally:
+            self._slots.release()
+
+        logger.debug("Hashing: espera en cola %.3fs, cálculo %.3fs", max(started - submitted, 0.0), hash_time)
+        return result
+
+
+hashing_pool = HashingPool(
+    workers=settings.HASHING_POOL_WORKERS,
+    max_pending=settings.HASHING_POOL_MAX_PENDING,
+    retry_after=settings.HASHING_RETRY_AFTER,
+)
@@ -0,0 +1,134 @@
+from asgiref.sync import sync_to_async
+from datetime import datetime, timezone as dt_timezone
+from django.db.models import Q
+from django.utils.encoding import force_bytes, force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+from .models import Transaction
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+TRANSACTION_TYPES = {choice for choice, _ in Transaction.TRANSACTION_TYPES}
+
+
+class HistoryQueryError(ValueError):
+    """Parámetros de consulta del historial inválidos."""
+
+
+def _parse_timestamp(value, name):
+    # Mismo formato que `transaction_date` en las respuestas: milisegundos desde epoch
+    try:
+        return datetime.fromtimestamp(int(value) / 1000, tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise HistoryQueryError(f"Invalid '{name}' timestamp")
+
+
+def filter_transactions(account, params):
+    """
+    Construye el queryset del historial de la cuenta a partir de los parámetros:
+    - direction: outgoing (por defecto), incoming o all
+    - from / to: rango de fechas en milisegundos desde epoch (to excluido)
+    - type: uno o varios transactionType separados por comas
+    Ordenado de más reciente a más antiguo por (transactionDate, id).
+    """
+    direction = params.get("direction", "outgoing")
+    if direction == "outgoing":
+        transactions = account.outgoingTransactions.all()
+    elif direction == "incoming":
+        transactions = account.incomingTransactions.all()
+    elif direction == "all":
+        transactions = Transaction.objects.filter(Q(sourceAccount=account) | Q(targetAccount=account))
+    else:
+        raise HistoryQueryError("Invalid 'direction', expected outgoing, incoming or all")
+
+    if params.get("from"):
+        transactions = transactions.filter(transactionDate__gte=_parse_timestamp(params["from"], "from"))
+    if params.get("to"):
+        transactions = transactions.filter(transactionDate__lt=_parse_timestamp(params["to"], "to"))
+
+    if params.get("type"):
+        types = {t.strip() for t in params["type"].split(",") if t.strip()}
+        if not types <= TRANSACTION_TYPES:
+            raise HistoryQueryError(f"Invalid 'type', expected any of {', '.join(sorted(TRANSACTION_TYPES))}")
+        transactions = transactions.filter(transactionType__in=types)
+
+    return transactions.order_by("-transactionDate", "-id")
+
+
+def encode_cursor(transaction):
+    return urlsafe_base64_encode(force_bytes(f"{transaction.transactionDate.isoformat()}|{transaction.id}"))
+
+
+def decode_cursor(cursor):
+    try:
+        date, pk = force_str(urlsafe_base64_decode(cursor)).rsplit("|", 1)
+        return datetime.fromisoformat(date), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise HistoryQueryError("Invalid 'cursor'")
+
+
+def parse_page_size(value):
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        page_size = int(value)
+    except ValueError:
+        raise HistoryQueryError("Invalid 'limit'")
+    if page_size < 1:
+        raise HistoryQueryError("Invalid 'limit'")
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def after_position(transactions, date, pk):
+    """Filtra las filas posteriores (más antiguas) a la posición (transactionDate, id)."""
+    return transactions.filter(Q(transactionDate__lt=date) | Q(transactionDate=date, id__lt=pk))
+
+
+def after_cursor(transactions, cursor):
+    """Filtra las filas posteriores (más antiguas) a la posición del cursor."""
+    return after_position(transactions, *decode_cursor(cursor))
+
+
+def keyset_page(transactions, cursor, page_size):
+    """
+    Devuelve (filas de la página, cursor siguiente o None) sin OFFSET: la página se localiza
+    con un rango sobre (transactionDate, id), así su coste no depende de la longitud del historial.
+    """
+    if cursor:
+        transactions = after_cursor(transactions, cursor)
+    rows = list(transactions.select_related("sourceAccount", "targetAccount")[:page_size + 1])
+    if len(rows) > page_size:
+        return rows[:page_size], encode_cursor(rows[page_size - 1])
+    return rows, None
+
+
+EXPORT_FIELDS = [
+    "id", "amount", "transactionType", "transaction_date", "source_account_number", "target_account_number",
+]
+EXPORT_BATCH_SIZE = 2000
+
+
+def _fetch_export_batch(columns, last, batch_size):
+    batch = after_position(columns, *last) if last else columns
+    return list(batch[:batch_size])
+
+
+async def iter_export_rows(transactions, batch_size=None):
+    """
+    Recorre el historial completo en lotes por rango de (transactionDate, id) y produce una tupla
+    por fila con los campos de EXPORT_FIELDS. Es un generador asíncrono: cada lote se lee con
+    sync_to_async y se envía antes de pedir el siguiente, así con ASGI el primer byte sale tras el
+    primer lote y la memoria no crece con el número de filas.
+    """
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    columns = transactions.values_list(
+        "id", "amount", "transactionType", "transactionDate",
+        "sourceAccount__accountNumber", "targetAccount__accountNumber",
+    )
+    last = None
+    while True:
+        rows = await sync_to_async(_fetch_export_batch)(columns, last, batch_size)
+        for pk, amount, transaction_type, date, source, target in rows:
+            yield pk, str(amount), transaction_type, int(date.timestamp() * 1000), source, target or "N/A"
+        if len(rows) < batch_size:
+            return
+        last = (rows[-1][3], rows[-1][0])
@@ -0,0 +1,207 @@
+"""
+Movimientos de dinero entre cuentas.
+
+Todas las operaciones que modifican `BankAccount.balance` pasan por este módulo:
+- Los cargos son UPDATE condicionales (`balance = balance - x WHERE balance >= x`), sin leer antes la fila.
+- Las transferencias bloquean las dos cuentas siempre en orden de pk para evitar interbloqueos.
+- Las operaciones con activos bloquean siempre la cuenta antes que el `UserAsset`.
+- La fila de `Transaction` se escribe en la misma transacción de base de datos que el movimiento.
+- Tras el commit se revalúa en segundo plano el patrimonio materializado de los usuarios afectados.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import BankAccount, Transaction, UserAsset
+from .user_cache import user_cache
+from .valuation import schedule_revaluation
+
+
+class InsufficientFunds(Exception):
+    """La cuenta no tiene saldo suficiente para el cargo."""
+
+
+class InsufficientHoldings(Exception):
+    """El usuario no tiene suficientes unidades del activo."""
+
+
+def _debit(account, amount):
+    updated = BankAccount.objects.filter(pk=account.pk, balance__gte=amount).update(balance=F("balance") - amount)
+    if not updated:
+        raise InsufficientFunds()
+    user_cache.invalidate(account.user_id)
+    schedule_revaluation(account.user_id)
+
+
+def _credit(account, amount):
+    BankAccount.objects.filter(pk=account.pk).update(balance=F("balance") + amount)
+    user_cache.invalidate(account.user_id)
+    schedule_revaluation(account.user_id)
+
+
+def _record(amount, transaction_type, source, target=None):
+    return Transaction.objects.create(
+        amount=amount,
+        transactionType=transaction_type,
+        sourceAccount=source,
+        targetAccount=target,
+        transactionDate=timezone.now(),
+    )
+
+
+def deposit(account, amount, transaction_type="CASH_DEPOSIT"):
+    """Abona `amount` en la cuenta y registra la transacción."""
+    with transaction.atomic():
+        _credit(account, amount)
+        return _record(amount, transaction_type, account)
+
+
+def withdraw(account, amount, transaction_type="CASH_WITHDRAWAL"):
+    """Carga `amount` en la cuenta si hay saldo; lanza InsufficientFunds si no."""
+    with transaction.atomic():
+        _debit(account, amount)
+        return _record(amount, transaction_type, account)
+
+
+def transfer(source, target, amount):
+    """Mueve `amount` de `source` a `target` bloqueando las cuentas en orden de pk."""
+    with transaction.atomic():
+        if source.pk <= target.pk:
+            _debit(source, amount)
+            _credit(target, amount)
+        else:
+            _credit(target, amount)
+            _debit(source, amount)  # Si falla, el rollback deshace el abono
+        return _record(amount, "CASH_TRANSFER", source, target)
+
+
+def buy_asset(user, account, asset_symbol, amount, price):
+    """
+    Carga `amount` en la cuenta y suma al activo las unidades equivalentes a `price`,
+    recalculando el precio medio de compra. Devuelve (activo, unidades compradas).
+    """
+    quantity = amount / price
+    with transaction.atomic():
+        _debit(account, amount)
+
+        asset, created = UserAsset.objects.select_for_update().get_or_create(
+            user=user,
+            assetSymbol=asset_symbol,
+            defaults={'quantity': quantity, 'purchase_price': price}
+        )
+        if not created:
+            # Si ya existe, actualizar la cantidad y ajustar el precio promedio de compra
+            new_quantity = asset.quantity + quantity
+            asset.purchase_price = (
+                (asset.purchase_price * asset.quantity) +
+                (price * quantity)
+            ) / new_quantity
+            asset.quantity = new_quantity
+            asset.save(update_fields=["quantity", "purchase_price"])
+
+        _record(amount, "ASSET_PURCHASE", account)
+    return asset, quantity
+
+
+def sell_asset(user, account, asset_symbol, quantity, price):
+    """
+    Resta `quantity` unidades del activo y abona su valor a `price` en la cuenta.
+    Lanza UserAsset.DoesNotExist o InsufficientHoldings. Devuelve (activo, importe de la venta).
+    """
+    with transaction.atomic():
+        # Cuenta antes que activo, el mismo orden que buy_asset y el bot, para no interbloquearse con ellos
+        BankAccount.objects.select_for_update().filter(pk=account.pk).values_list("pk", flat=True).get()
+        asset = UserAsset.objects.select_for_update().get(user=user, assetSymbol=asset_symbol)
+        if asset.quantity < quantity:
+            raise InsufficientHoldings()
+
+        total_sale_value = Decimal(quantity) * price
+        asset.quantity -= quantity
+        asset.save(update_fields=["quantity"])
+        _credit(account, total_sale_value)
+        _record(total_sale_value, "ASSET_SELL", account)
+    return asset, total_sale_value
+
+
+def bulk_transfer(source, legs, chunk_size=500):
+    """
+    Ejecuta una lista de transferencias `(targetAccountNumber, amount)` desde `source`.
+
+    Las cuentas destino se resuelven con una sola consulta IN. Cada bloque de `chunk_size` tramos
+    bloquea origen y destinos en orden de pk, carga el total del bloque en el origen con un único
+    UPDATE masivo junto a los abonos e inserta todas sus transacciones con bulk_create.
+    Devuelve un informe por tramo en el mismo orden de `legs`.
+    """
+    targets = dict(
+        BankAccount.objects.filter(accountNumber__in={number for number, _ in legs})
+        .values_list("accountNumber", "pk")
+    )
+    results = []
+
+    for start in range(0, len(legs), chunk_size):
+        chunk = []
+        for index, (number, amount) in enumerate(legs[start:start + chunk_size], start):
+            result = {"index": index, "targetAccountNumber": number, "amount": str(amount)}
+            results.append(result)
+            if number not in targets:
+                result.update(status="failed", detail="Target account not found")
+            else:
+                chunk.append((result, targets[number], amount))
+        if not chunk:
+            continue
+
+        chunk_total = sum(amount for _, _, amount in chunk)
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                accounts = {
+                    account.pk: account
+                    for account in BankAccount.objects.select_for_update()
+                    .filter(pk__in={source.pk} | {target_id for _, target_id, _ in chunk})
+                    .order_by("pk")
+                }
+                source_account = accounts[source.pk]
+                if source_account.balance < chunk_total:
+                    raise InsufficientFunds()
+
+                source_account.balance -= chunk_total
+                transactions = []
+                for _, target_id, amount in chunk:
+                    accounts[target_id].balance += amount
+                    transactions.append(Transaction(
+                        amount=amount,
+                        transactionType="CASH_TRANSFER",
+                        sourceAccount=source_account,
+                        targetAccount=accounts[target_id],
+                        transactionDate=now,
+                    ))
+                settle_batch(accounts.values(), transactions)
+        except InsufficientFunds:
+            for result, _, _ in chunk:
+                result.update(status="failed", detail="Insufficient balance")
+            continue
+
+        for result, _, _ in chunk:
+            result.update(status="completed")
+
+    return results
+
+
+def lock_accounts(user_ids):
+    """
+    Bloquea (SELECT ... FOR UPDATE, en orden de pk) las cuentas de los usuarios y las devuelve por user_id.
+    Debe llamarse dentro de transaction.atomic(); el saldo leído es definitivo hasta el commit.
+    """
+    return {
+        account.user_id: account
+        for account in BankAccount.objects.select_for_update().filter(user_id__in=user_ids).order_by("pk")
+    }
+
+
+def settle_batch(accounts, transactions):
+    """Guarda los saldos de cuentas bloqueadas con lock_accounts y registra sus transacciones."""
+    accounts = list(accounts)
+    BankAccount.objects.bulk_update(accounts, ["balance"])
+    user_cache.invalidate(*(account.user_id for account in accounts))
+    schedule_revaluation(*(account.user_id for account in accounts))
+    Transaction.objects.bulk_create(transactions)
@@ -0,0 +1,198 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import EmailValidator
+from django.db import transaction
+from rest_framework import serializers
+from users.account_numbers import allocate_account_number, claim_block
+from users.hashing import init_worker
+from users.models import BankAccount, CustomUser
+from users.serializers import UserRegistrationSerializer
+
+REQUIRED_FIELDS = ["name", "email", "address", "phoneNumber"]
+MAX_LENGTHS = {"name": 100, "email": 254, "address": 255, "phoneNumber": 15, "countryCode": 10}
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa usuarios en bloque desde un fichero CSV o NDJSON. "
+        "Las filas rechazadas se escriben en un fichero de rechazos y el progreso en un checkpoint "
+        "que permite reanudar la importación con --resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Fichero CSV (con cabecera) o NDJSON con los usuarios.")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Formato del fichero (por defecto, según la extensión).")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Filas validadas e insertadas por transacción.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos para el hashing de contraseñas.")
+        parser.add_argument("--rejects", help="Fichero NDJSON de rechazos (por defecto <path>.rejects.ndjson).")
+        parser.add_argument("--resume", action="store_true", help="Continúa desde el último bloque confirmado.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"No existe el fichero {path}")
+
+        file_format = options["format"] or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+        checkpoint_path = f"{path}.checkpoint"
+        rejects_path = options["rejects"] or f"{path}.rejects.ndjson"
+
+        start_after = 0
+        if options["resume"] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                start_after = int(f.read().strip() or 0)
+            self.stdout.write(f"Reanudando después de la línea {start_after}")
+
+        self.workers = options["workers"]
+        self.imported = 0
+        self.rejected = 0
+        with open(path, newline="", encoding="utf-8") as source, \
+                open(rejects_path, "a" if options["resume"] else "w", encoding="utf-8") as rejects, \
+                ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker) as pool:
+            chunk = []
+            for line_number, row in self._read_rows(source, file_format):
+                if line_number <= start_after:
+                    continue
+                chunk.append((line_number, row))
+                if len(chunk) >= options["chunk_size"]:
+                    self._import_chunk(chunk, pool, rejects, checkpoint_path)
+                    chunk = []
+            if chunk:
+                self._import_chunk(chunk, pool, rejects, checkpoint_path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Importados {self.imported} usuarios, {self.rejected} rechazados (ver {rejects_path})"
+        ))
+
+    def _read_rows(self, source, file_format):
+        """Produce (número de línea, fila) sin cargar el fichero entero en memoria."""
+        if file_format == "csv":
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else {"__invalid__": line.strip()}
+
+    def _validate_row(self, row):
+        """Valida una fila sin consultar la base de datos. Devuelve la lista de errores."""
+        if "__invalid__" in row:
+            return ["Invalid JSON line"]
+
+        errors = [f"{field} is required" for field in REQUIRED_FIELDS if not str(row.get(field) or "").strip()]
+        errors += [
+            f"{field} must be at most {length} characters"
+            for field, length in MAX_LENGTHS.items() if len(str(row.get(field) or "")) > length
+        ]
+        if errors:
+            return errors
+
+        try:
+            EmailValidator(message="Invalid email")(row["email"])
+        except DjangoValidationError as e:
+            errors += e.messages
+
+        # Se acepta una contraseña en claro o un hash ya generado por un hasher soportado
+        if row.get("hashedPassword"):
+            try:
+                identify_hasher(row["hashedPassword"])
+            except ValueError:
+                errors.append("Unknown password hash format")
+        else:
+            try:
+                UserRegistrationSerializer().validate_password(row.get("password") or "")
+            except serializers.ValidationError as e:
+                errors += [str(detail) for detail in e.detail]
+        return errors
+
+    def _import_chunk(self, chunk, pool, rejects, checkpoint_path):
+        rejected = []
+        valid = []
+        emails = {}  # En minúsculas -> tal como viene en la fila
+        phones = set()
+
+        for line_number, row in chunk:
+            errors = self._validate_row(row)
+            if not errors:
+                # Duplicados dentro del propio bloque; el email único de MySQL no distingue mayúsculas
+                if row["email"].lower() in emails:
+                    errors.append(f"Invalid email: {row['email']}")
+                if row["phoneNumber"] in phones:
+                    errors.append("Phone number already exists")
+            if errors:
+                rejected.append((line_number, row, errors))
+                continue
+            emails[row["email"].lower()] = row["email"]
+            phones.add(row["phoneNumber"])
+            valid.append((line_number, row))
+
+        # Unicidad frente a la base de datos con dos consultas IN por bloque
+        existing_emails = {
+            email.lower() for email in CustomUser.objects.filter(email__in=emails.values()).values_list("email", flat=True)
+        }
+        existing_phones = set(CustomUser.objects.filter(phoneNumber__in=phones).values_list("phoneNumber", flat=True))
+        rows = []
+        for line_number, row in valid:
+            errors = []
+            if row["email"].lower() in existing_emails:
+                errors.append(f"Invalid email: {row['email']}")
+            if row["phoneNumber"] in existing_phones:
+                errors.append("Phone number already exists")
+            if errors:
+                rejected.append((line_number, row, errors))
+            else:
+                rows.append(row)
+
+        if rows:
+            self._insert_users(rows, pool)
+
+        for line_number, row, errors in sorted(rejected, key=lambda r: r[0]):
+            row = {key: value for key, value in row.items() if key not in ("password", "hashedPassword")}
+            rejects.write(json.dumps({"line": line_number, "row": row, "errors": errors}) + "\n")
+        rejects.flush()
+
+        # Checkpoint: última línea cuyo bloque está confirmado
+        with open(checkpoint_path, "w") as f:
+            f.write(str(chunk[-1][0]))
+
+        self.imported += len(rows)
+        self.rejected += len(rejected)
+        self.stdout.write(f"Línea {chunk[-1][0]}: {self.imported} importados, {self.rejected} rechazados")
+
+    def _insert_users(self, rows, pool):
+        plain = [row["password"] for row in rows if not row.get("hashedPassword")]
+        hashed = iter(pool.map(make_password, plain, chunksize=max(len(plain) // (self.workers * 4), 1)))
+        numbers = claim_block(len(rows))
+
+        users = []
+        for row in rows:
+            users.append(CustomUser(
+                name=row["name"],
+                email=row["email"],
+                address=row["address"],
+                phoneNumber=row["phoneNumber"],
+                countryCode=row.get("countryCode") or "",
+                password=row.get("hashedPassword") or next(hashed),
+                accountNumber=numbers.pop() if numbers else allocate_account_number(),
+            ))
+
+        # bulk_create no emite post_save: las cuentas bancarias se crean aquí en bloque
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users)
+            ids = dict(
+                CustomUser.objects.filter(email__in=[user.email for user in users]).values_list("email", "id")
+            )
+            BankAccount.objects.bulk_create([
+                BankAccount(user_id=ids[user.email], accountNumber=user.accountNumber) for user in users
+            ])
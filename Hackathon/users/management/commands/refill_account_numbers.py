@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.account_numbers import PoolExhausted, refill_pool
+
+
+class Command(BaseCommand):
+    help = "Rellena el pool de números de cuenta libres usado en el registro de usuarios."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--free", type=int, default=100000,
+            help="Número de entradas libres que debe tener el pool al terminar.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            added = refill_pool(options["free"])
+        except PoolExhausted as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Añadidos {added} números de cuenta al pool"))
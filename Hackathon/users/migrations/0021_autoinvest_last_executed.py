@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0020_alter_autoinvest_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autoinvest',
+            name='last_executed',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:25
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_trigger_prices(apps, schema_editor):
+    UserAsset = apps.get_model('users', 'UserAsset')
+    UserAsset.objects.update(
+        buy_trigger_price=F('purchase_price') * Decimal('0.8'),
+        sell_trigger_price=F('purchase_price') * Decimal('1.2'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0021_autoinvest_last_executed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userasset',
+            name='buy_trigger_price',
+            field=models.DecimalField(decimal_places=4, default=Decimal('0.0'), max_digits=17),
+        ),
+        migrations.AddField(
+            model_name='userasset',
+            name='sell_trigger_price',
+            field=models.DecimalField(decimal_places=4, default=Decimal('0.0'), max_digits=17),
+        ),
+        migrations.RunPython(fill_trigger_prices, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='userasset',
+            index=models.Index(fields=['assetSymbol', 'buy_trigger_price'], name='userasset_buy_trigger_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userasset',
+            index=models.Index(fields=['assetSymbol', 'sell_trigger_price'], name='userasset_sell_trigger_idx'),
+        ),
+    ]
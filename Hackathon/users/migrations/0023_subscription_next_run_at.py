@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:26
+
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def fill_next_run_at(apps, schema_editor):
+    Subscription = apps.get_model('users', 'Subscription')
+    pending = []
+    for subscription in Subscription.objects.filter(next_run_at__isnull=True).iterator(chunk_size=1000):
+        subscription.next_run_at = subscription.last_executed + timedelta(seconds=subscription.interval_seconds)
+        pending.append(subscription)
+        if len(pending) >= 1000:
+            Subscription.objects.bulk_update(pending, ['next_run_at'])
+            pending = []
+    if pending:
+        Subscription.objects.bulk_update(pending, ['next_run_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0022_userasset_trigger_prices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subscription',
+            name='next_run_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_next_run_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['is_active', 'next_run_at'], name='subscription_due_idx'),
+        ),
+    ]
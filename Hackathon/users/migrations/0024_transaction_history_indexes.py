@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0023_subscription_next_run_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['sourceAccount', 'transactionDate', 'id'], name='transaction_source_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['targetAccount', 'transactionDate', 'id'], name='transaction_target_date_idx'),
+        ),
+    ]
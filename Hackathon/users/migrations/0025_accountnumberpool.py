@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0024_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountNumberPool',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(max_length=6, unique=True)),
+                ('claimed', models.BooleanField(db_index=True, default=False)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0026_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cash', models.DecimalField(decimal_places=2, default=0.0, max_digits=10)),
+                ('assets', models.JSONField(default=dict)),
+                ('total', models.DecimalField(db_index=True, decimal_places=4, default=0.0, max_digits=20)),
+                ('price_version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='valuation', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -1,4 +1,3 @@
-import uuid
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.db import models
 from django.utils.translation import gettext_lazy as _
@@ -33,18 +32,24 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     def save(self, *args, **kwargs):
         if not self.accountNumber:
-            while True:
-                # Genera un número de cuenta de 6 caracteres único
-                new_account_number = uuid.uuid4().hex[:6]
-                if not CustomUser.objects.filter(accountNumber=new_account_number).exists():
-                    self.accountNumber = new_account_number
-                    break
+            # Toma un número libre del bloque reservado por este proceso
+            from .account_numbers import allocate_account_number
+            self.accountNumber = allocate_account_number()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.email
 
 
+class AccountNumberPool(models.Model):
+    """Números de cuenta pregenerados y libres; cada proceso reserva bloques de ellos."""
+    number = models.CharField(max_length=6, unique=True)
+    claimed = models.BooleanField(default=False, db_index=True)
+
+    def __str__(self):
+        return self.number
+
+
 class BankAccount(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='account')
     accountNumber = models.CharField(max_length=6, unique=True)
@@ -74,19 +79,117 @@ class Transaction(models.Model):
         "BankAccount", related_name="incomingTransactions", on_delete=models.CASCADE, null=True, blank=True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['sourceAccount', 'transactionDate', 'id'], name='transaction_source_date_idx'),
+            models.Index(fields=['targetAccount', 'transactionDate', 'id'], name='transaction_target_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transactionType} of {self.amount} on {self.transactionDate}"
 
+class PortfolioValuation(models.Model):
+    """
+    Valoración materializada del patrimonio de un usuario: efectivo, valor de cada activo y total,
+    calculada con el snapshot de precios `price_version`. La mantienen las tareas de revaluación.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='valuation')
+    cash = models.DecimalField(max_digits=10, decimal_places=2, default=0.0)
+    assets = models.JSONField(default=dict)
+    total = models.DecimalField(max_digits=20, decimal_places=4, default=0.0, db_index=True)
+    price_version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Net worth of {self.user_id}: {self.total}"
+
+class OutboxEmail(models.Model):
+    """Correo pendiente de envío, escrito en la misma transacción que la operación que lo genera."""
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("SENT", "Sent"),
+        ("FAILED", "Failed"),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(choices=STATUS_CHOICES, max_length=10, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} email '{self.subject}' to {', '.join(self.recipients)}"
+
+
+class UserAssetQuerySet(models.QuerySet):
+    """
+    Mantiene los precios de disparo sincronizados también en las escrituras masivas
+    (`update` y `bulk_update`), que no pasan por `UserAsset.save()`.
+    """
+
+    def update(self, **kwargs):
+        if 'purchase_price' in kwargs:
+            purchase_price = kwargs['purchase_price']
+            if not hasattr(purchase_price, 'resolve_expression'):
+                purchase_price = Decimal(purchase_price)
+            kwargs.setdefault('buy_trigger_price', purchase_price * UserAsset.BUY_TRIGGER_RATIO)
+            kwargs.setdefault('sell_trigger_price', purchase_price * UserAsset.SELL_TRIGGER_RATIO)
+        return super().update(**kwargs)
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if 'purchase_price' in fields:
+            for obj in objs:
+                obj.update_trigger_prices()
+            fields = list(fields) + [
+                field for field in ('buy_trigger_price', 'sell_trigger_price') if field not in fields
+            ]
+        return super().bulk_update(objs, fields, batch_size=batch_size)
 
 
 class UserAsset(models.Model):
+    # Reglas del bot de auto-inversión respecto al precio de compra
+    BUY_TRIGGER_RATIO = Decimal('0.8')
+    SELL_TRIGGER_RATIO = Decimal('1.2')
+
+    objects = UserAssetQuerySet.as_manager()
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="assets")
     assetSymbol = models.CharField(max_length=10)
     quantity = models.DecimalField(max_digits=15, decimal_places=8, default=Decimal('0.0'))
     purchase_price = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.0'))
+    # Precios de disparo precalculados: compra si el precio baja de buy_trigger_price, vende si supera sell_trigger_price
+    buy_trigger_price = models.DecimalField(max_digits=17, decimal_places=4, default=Decimal('0.0'))
+    sell_trigger_price = models.DecimalField(max_digits=17, decimal_places=4, default=Decimal('0.0'))
 
     class Meta:
         unique_together = ('user', 'assetSymbol')
+        indexes = [
+            models.Index(fields=['assetSymbol', 'buy_trigger_price'], name='userasset_buy_trigger_idx'),
+            models.Index(fields=['assetSymbol', 'sell_trigger_price'], name='userasset_sell_trigger_idx'),
+        ]
+
+    def update_trigger_prices(self):
+        """Sincroniza los precios de disparo con el precio de compra actual."""
+        purchase_price = Decimal(self.purchase_price)
+        self.buy_trigger_price = purchase_price * self.BUY_TRIGGER_RATIO
+        self.sell_trigger_price = purchase_price * self.SELL_TRIGGER_RATIO
+
+    def save(self, *args, **kwargs):
+        self.update_trigger_prices()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'purchase_price' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'buy_trigger_price', 'sell_trigger_price'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user}'s holdings of {self.assetSymbol}"
@@ -96,8 +199,23 @@ class Subscription(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     interval_seconds = models.IntegerField()
     last_executed = models.DateTimeField(default=timezone.now)
+    next_run_at = models.DateTimeField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'next_run_at'], name='subscription_due_idx'),
+        ]
+
+    def schedule_next_run(self):
+        """Calcula el próximo cobro a partir de la última ejecución."""
+        self.next_run_at = self.last_executed + timedelta(seconds=self.interval_seconds)
+
+    def save(self, *args, **kwargs):
+        if self.next_run_at is None:
+            self.schedule_next_run()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Subscription for {self.user} every {self.interval_seconds} seconds"
 
@@ -106,6 +224,7 @@ class AutoInvest(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    last_executed = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"AutoInvest bot for {self.user.email}"
\ No newline at end of file
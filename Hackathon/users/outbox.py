@@ -0,0 +1,102 @@
+"""
+Outbox de correos transaccionales.
+
+Las vistas no hablan con el servidor SMTP: escriben el correo en `OutboxEmail` dentro de la misma
+transacción que la operación de negocio y, tras el commit, se programa su envío. Un worker de Celery
+reclama los pendientes por lotes (SELECT ... FOR UPDATE SKIP LOCKED) y los envía reutilizando una
+sola conexión SMTP por lote, con reintentos y espera exponencial por mensaje.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from .models import OutboxEmail
+
+
+def enqueue_email(subject, body, recipients, from_email="no-reply@banking.com"):
+    """
+    Guarda un correo en el outbox. Llamar dentro de la transacción de la operación que lo genera:
+    si esta hace rollback, el correo no se envía.
+    """
+    email = OutboxEmail.objects.create(
+        subject=subject, body=body, from_email=from_email, recipients=list(recipients)
+    )
+    transaction.on_commit(_trigger_delivery)
+    return email
+
+
+def _trigger_delivery():
+    from .dispatch import trigger_outbox_delivery
+    trigger_outbox_delivery()
+
+
+def deliver_pending(batch_size=None):
+    """Envía los correos pendientes cuyo próximo intento ha vencido, lote a lote, hasta vaciar la cola."""
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    summary = {"sent": 0, "retried": 0, "failed": 0}
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                OutboxEmail.objects.select_for_update(skip_locked=True)
+                .filter(status="PENDING", next_attempt_at__lte=timezone.now())
+                .order_by("next_attempt_at", "id")[:batch_size]
+            )
+            if not batch:
+                break
+            _send_batch(batch, summary)
+            OutboxEmail.objects.bulk_update(
+                batch, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
+            )
+        if len(batch) < batch_size:
+            break
+
+    return summary
+
+
+def _send_batch(batch, summary):
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # Sin conexión con el servidor SMTP se reintenta todo el lote
+        for email in batch:
+            _mark_failed(email, e, summary)
+        return
+
+    try:
+        for email in batch:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email,
+                to=email.recipients,
+                connection=connection,
+            )
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                _mark_failed(email, e, summary)
+                continue
+            email.status = "SENT"
+            email.attempts += 1
+            email.sent_at = timezone.now()
+            email.last_error = ""
+            summary["sent"] += 1
+    finally:
+        connection.close()
+
+
+def _mark_failed(email, error, summary):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        email.status = "FAILED"
+        summary["failed"] += 1
+        print(f"Correo {email.pk} descartado tras {email.attempts} intentos: {error}")
+        return
+    email.next_attempt_at = timezone.now() + timedelta(
+        seconds=settings.OUTBOX_RETRY_BACKOFF * 2 ** (email.attempts - 1)
+    )
+    summary["retried"] += 1
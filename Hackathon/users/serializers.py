@@ -1,6 +1,9 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.core.validators import EmailValidator
 from .models import CustomUser, Transaction, UserAsset, Subscription
+from . import step_up
+from .hashing import hashing_pool
 from decimal import Decimal
 
 
@@ -55,8 +58,8 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
             phoneNumber=validated_data["phoneNumber"],
             countryCode=validated_data["countryCode"]
         )
-        # Guarda la contraseña en formato hash
-        user.set_password(validated_data["password"])
+        # Guarda la contraseña en formato hash (calculado en el pool de hashing)
+        user.password = hashing_pool.make_password(validated_data["password"])
         user.save()
         return user
 
@@ -88,30 +91,51 @@ class TransactionSerializer(serializers.ModelSerializer):
         return int(obj.transactionDate.timestamp() * 1000)
 
 
-class DepositSerializer(serializers.Serializer):
-    pin = serializers.CharField(max_length=4, required=True)
+class PinAuthorizedSerializer(serializers.Serializer):
+    """Operaciones autorizadas con el PIN o, en su lugar, con un token de step-up vigente."""
+    pin = serializers.CharField(max_length=4, required=False)
+    stepUpToken = serializers.CharField(required=False)
+
+    def validate(self, attrs):
+        if not attrs.get("pin") and not attrs.get("stepUpToken"):
+            raise serializers.ValidationError({"pin": ["This field is required."]})
+        return attrs
+
+
+class DepositSerializer(PinAuthorizedSerializer):
+    amount = serializers.DecimalField(
+        max_digits=10, decimal_places=2, required=True, min_value=Decimal('0.01'))
+
+
+class WithdrawSerializer(PinAuthorizedSerializer):
     amount = serializers.DecimalField(
         max_digits=10, decimal_places=2, required=True, min_value=Decimal('0.01'))
 
 
-class WithdrawSerializer(serializers.Serializer):
-    pin = serializers.CharField(max_length=4, required=True)
+class TransferFundsSerializer(PinAuthorizedSerializer):
+    targetAccountNumber = serializers.CharField(max_length=6, required=True)
     amount = serializers.DecimalField(
         max_digits=10, decimal_places=2, required=True, min_value=Decimal('0.01'))
 
 
-class TransferFundsSerializer(serializers.Serializer):
+class BulkTransferLegSerializer(serializers.Serializer):
     targetAccountNumber = serializers.CharField(max_length=6, required=True)
     amount = serializers.DecimalField(
         max_digits=10, decimal_places=2, required=True, min_value=Decimal('0.01'))
-    pin = serializers.CharField(max_length=4, required=True)
 
 
-class BuyAssetSerializer(serializers.Serializer):
+class BulkTransferSerializer(PinAuthorizedSerializer):
+    transfers = serializers.ListField(
+        child=BulkTransferLegSerializer(),
+        allow_empty=False,
+        max_length=settings.BULK_TRANSFER_MAX_LEGS,
+    )
+
+
+class BuyAssetSerializer(PinAuthorizedSerializer):
     assetSymbol = serializers.CharField(max_length=10, required=True)
     amount = serializers.DecimalField(
         max_digits=15, decimal_places=2, required=True, min_value=Decimal('0.01'))
-    pin = serializers.CharField(max_length=4, required=True)
 
     def create_or_update_user_asset(self, user, assetSymbol, quantity, purchase_price):
         """
@@ -137,7 +161,7 @@ class BuyAssetSerializer(serializers.Serializer):
         return asset
 
 
-class SellAssetSerializer(serializers.Serializer):
+class SellAssetSerializer(PinAuthorizedSerializer):
     assetSymbol = serializers.CharField(
         max_length=10,
         required=True,
@@ -152,7 +176,7 @@ class SellAssetSerializer(serializers.Serializer):
     )
     pin = serializers.CharField(
         max_length=4,
-        required=True,
+        required=False,
         help_text="PIN de 4 dígitos del usuario para verificar la transacción."
     )
 
@@ -166,23 +190,30 @@ class UserAssetInfoSerializer(serializers.ModelSerializer):
         fields = ['assetSymbol', 'quantity']
 
 
-class SubscriptionSerializer(serializers.Serializer):
-    pin = serializers.CharField(max_length=4)
+class SubscriptionSerializer(PinAuthorizedSerializer):
     amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
     intervalSeconds = serializers.IntegerField(min_value=1)
 
-    def validate_pin(self, value):
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
         user = self.context['request'].user
-        if not user.check_pin(value):
-            raise serializers.ValidationError("Invalid PIN")
-        return value
+        if not step_up.authorize(user, attrs, "subscribe"):
+            raise serializers.ValidationError({"pin": ["Invalid PIN"]})
+        return attrs
 
 
-class AutoInvestBotSerializer(serializers.Serializer):
-    pin = serializers.CharField(max_length=4)
-
-    def validate_pin(self, value):
+class AutoInvestBotSerializer(PinAuthorizedSerializer):
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
         user = self.context['request'].user
-        if not user.check_pin(value):
-            raise serializers.ValidationError("Invalid PIN")
-        return value
\ No newline at end of file
+        if not step_up.authorize(user, attrs, "auto_invest"):
+            raise serializers.ValidationError({"pin": ["Invalid PIN"]})
+        return attrs
+
+
+class StepUpTokenSerializer(serializers.Serializer):
+    pin = serializers.CharField(max_length=4)
+    operations = serializers.ListField(
+        child=serializers.ChoiceField(choices=sorted(step_up.OPERATIONS)),
+        allow_empty=False,
+    )
\ No newline at end of file
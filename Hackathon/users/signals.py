@@ -1,6 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from market.signals import prices_published
 from .models import CustomUser, BankAccount
+from .user_cache import user_cache
 
 @receiver(post_save, sender=CustomUser)
 def create_bank_account(sender, instance, created, **kwargs):
@@ -9,3 +11,29 @@ def create_bank_account(sender, instance, created, **kwargs):
     """
     if created:
         BankAccount.objects.create(user=instance, accountNumber=instance.accountNumber)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Invalida el usuario en la caché de autenticación al cambiar sus datos, contraseña o PIN.
+    """
+    user_cache.invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=BankAccount)
+def invalidate_cached_account(sender, instance, **kwargs):
+    """
+    Invalida el usuario en la caché de autenticación al cambiar su cuenta bancaria.
+    """
+    user_cache.invalidate(instance.user_id)
+
+
+@receiver(prices_published)
+def revalue_portfolios_on_price_change(sender, snapshot, changed, **kwargs):
+    """
+    Revalúa en segundo plano el patrimonio de quienes poseen algún activo cuyo precio ha cambiado,
+    con los precios de este mismo snapshot y no con los que el worker tenga en su caché local.
+    """
+    from .tasks import revalue_holders
+    revalue_holders.delay(sorted(changed), {"version": snapshot["version"], "prices": snapshot["prices"]})
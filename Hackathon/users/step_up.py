@@ -0,0 +1,78 @@
+import uuid
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+# Operaciones de dinero que pueden autorizarse con un token de step-up
+OPERATIONS = {
+    "deposit", "withdraw", "transfer", "bulk_transfer", "buy", "sell", "subscribe", "auto_invest",
+}
+
+SALT = "users.step_up"
+
+
+def _uses_key(jti):
+    return f"step-up:{jti}"
+
+
+def _pin_fingerprint(user):
+    # Cambiar el PIN invalida todos los tokens emitidos con el anterior
+    return salted_hmac(SALT, user.encrypted_pin or "").hexdigest()[:16]
+
+
+def issue_token(user, operations):
+    """
+    Emite un token firmado y de vida corta ligado al usuario, a su PIN actual y a las operaciones indicadas.
+    Debe llamarse solo después de verificar el PIN. Devuelve (token, segundos de validez).
+    """
+    ttl = settings.STEP_UP_TOKEN_TTL
+    jti = uuid.uuid4().hex
+    token = signing.dumps(
+        {"uid": user.pk, "ops": sorted(operations), "jti": jti, "pin": _pin_fingerprint(user)},
+        salt=SALT,
+    )
+    # Contador de usos en Redis: limita la reutilización del token y permite revocarlo
+    cache.set(_uses_key(jti), 0, timeout=ttl)
+    return token, ttl
+
+
+def verify_token(user, token, operation):
+    """Comprueba firma, caducidad, usuario, PIN y operación, y consume un uso del token."""
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=settings.STEP_UP_TOKEN_TTL)
+    except signing.BadSignature:
+        return False
+
+    if payload.get("uid") != user.pk or operation not in payload.get("ops", ()):
+        return False
+    if not constant_time_compare(payload.get("pin", ""), _pin_fingerprint(user)):
+        return False
+
+    try:
+        uses = cache.incr(_uses_key(payload["jti"]))
+    except ValueError:
+        # El contador ha caducado o el token ha sido revocado
+        return False
+    return uses <= settings.STEP_UP_TOKEN_MAX_USES
+
+
+def revoke_token(token):
+    """Revoca un token antes de su caducidad."""
+    try:
+        payload = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        return
+    cache.delete(_uses_key(payload["jti"]))
+
+
+def authorize(user, data, operation):
+    """
+    Autoriza una operación de dinero con el token de step-up (`stepUpToken`) si se envía,
+    o con el PIN (`pin`) en caso contrario.
+    """
+    token = data.get("stepUpToken")
+    if token:
+        return verify_token(user, token, operation)
+    pin = data.get("pin")
+    return bool(pin) and user.check_pin(pin)
@@ -0,0 +1,64 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from . import ledger
+from .models import Subscription, Transaction
+
+# Suscripciones liquidadas por cada transacción de base de datos
+CHUNK_SIZE = 500
+
+
+def process_due_subscriptions(now=None):
+    """
+    Liquida las suscripciones cuyo `next_run_at` ya ha llegado, en bloques ordenados por vencimiento.
+    Solo se leen las filas vencidas, de modo que el coste depende de cuántas vencen y no del total activo.
+    """
+    now = now or timezone.now()
+    summary = {"charged": 0, "deactivated": 0}
+
+    due = Subscription.objects.filter(is_active=True, next_run_at__lte=now)
+
+    while True:
+        with transaction.atomic():
+            subscriptions = list(
+                due.select_for_update(skip_locked=True).order_by("next_run_at")[:CHUNK_SIZE]
+            )
+            if not subscriptions:
+                break
+            charged, deactivated = _settle_chunk(subscriptions, now)
+
+        summary["charged"] += charged
+        summary["deactivated"] += deactivated
+
+    return summary
+
+
+def _settle_chunk(subscriptions, now):
+    accounts = ledger.lock_accounts({s.user_id for s in subscriptions})
+
+    changed_accounts = {}
+    transactions = []
+    deactivated = 0
+    for subscription in subscriptions:
+        account = accounts.get(subscription.user_id)
+        if account is not None and account.balance >= subscription.amount:
+            # Descontar el monto y programar el siguiente cobro
+            account.balance -= subscription.amount
+            changed_accounts[account.pk] = account
+            transactions.append(Transaction(
+                amount=subscription.amount,
+                transactionType="SUBSCRIPTION",
+                sourceAccount=account,
+                transactionDate=now,
+            ))
+            subscription.last_executed = now
+            subscription.next_run_at = now + timedelta(seconds=subscription.interval_seconds)
+        else:
+            # Desactivar la suscripción si no hay saldo suficiente
+            subscription.is_active = False
+            deactivated += 1
+
+    ledger.settle_batch(changed_accounts.values(), transactions)
+    Subscription.objects.bulk_update(subscriptions, ["last_executed", "next_run_at", "is_active"])
+
+    return len(transactions), deactivated
@@ -1,105 +1,117 @@
-from celery import shared_task
-from django.utils import timezone
-from django.contrib.auth import get_user_model
-from .utils import get_market_price
-from .models import Subscription, Transaction, AutoInvest, UserAsset
+import time
+from datetime import datetime
 from decimal import Decimal
+from celery import shared_task, group, chord
+from django.conf import settings
+from django.utils import timezone
+from market.price_feed import PriceFeedError
+from . import ledger, outbox, valuation
+from .models import BankAccount
+from .subscriptions import process_due_subscriptions
+from .auto_invest import load_prices, run_auto_invest, triggered_user_ids
 
 @shared_task
 def process_subscriptions():
-    """Procesa las suscripciones activas descontando el monto establecido en cada intervalo de tiempo."""
-    subscriptions = Subscription.objects.filter(is_active=True)
-    current_time = timezone.now()
-
-    for subscription in subscriptions:
-        user = subscription.user
-
-        # Verificar si el intervalo de tiempo ha pasado
-        if (current_time - subscription.last_executed).total_seconds() >= subscription.interval_seconds:
-            if user.account.balance >= subscription.amount:
-                # Actualizar el balance del usuario
-                user.account.balance -= subscription.amount
-                user.account.save()
-
-                # Registrar la transacción
-                Transaction.objects.create(
-                    amount=subscription.amount,
-                    transactionType="SUBSCRIPTION",
-                    sourceAccount=user.account,
-                    transactionDate=current_time
-                )
-
-                # Actualizar el último tiempo de ejecución de la suscripción
-                subscription.last_executed = current_time
-                subscription.save()
-            else:
-                # Desactivar la suscripción si no hay saldo suficiente
-                subscription.is_active = False
-                subscription.save()
+    """Procesa las suscripciones vencidas descontando el monto establecido en cada intervalo de tiempo."""
+    return process_due_subscriptions()
 
 @shared_task
 def auto_invest_bot():
-    """Automatiza la compra y venta de activos para todos los usuarios con auto-inversión activa."""
-
-    # Obtenemos el modelo de usuario personalizado
-    CustomUser = get_user_model()
-
-    # Filtramos todos los usuarios con auto-inversión activa
-    auto_invest_users = AutoInvest.objects.filter(is_active=True)
-
-    for auto_invest in auto_invest_users:
-        user = auto_invest.user
-
-        # Procesar cada activo del usuario
-        assets = user.assets.all()
-        for asset in assets:
-            try:
-                # Obtenemos el precio de mercado actual del activo y lo convertimos a Decimal
-                current_price = Decimal(get_market_price(asset.assetSymbol))
-
-                # Condición de compra: Si el precio cae un 20% por debajo del precio de compra original
-                if current_price < asset.purchase_price * Decimal('0.8'):
-                    amount_to_buy = asset.quantity * Decimal('0.1')
-                    total_cost = amount_to_buy * current_price
-                    if user.account.balance >= total_cost:
-                        # Actualizar el balance y la cantidad del activo
-                        asset.quantity += amount_to_buy
-                        asset.save()
-                        user.account.balance -= total_cost
-                        user.account.save()
-
-                        # Registrar la transacción de compra
-                        Transaction.objects.create(
-                            amount=total_cost,
-                            transactionType="ASSET_PURCHASE",
-                            sourceAccount=user.account,
-                            transactionDate=timezone.now()
-                        )
-
-                # Condición de venta: Si el precio sube un 20% por encima del precio de compra original
-                elif current_price > asset.purchase_price * Decimal('1.2'):
-                    amount_to_sell = asset.quantity * Decimal('0.1')
-                    total_revenue = amount_to_sell * current_price
-                    if amount_to_sell > 0:
-                        # Actualizar la cantidad del activo y el balance del usuario
-                        asset.quantity -= amount_to_sell
-                        asset.save()
-                        user.account.balance += total_revenue
-                        user.account.save()
-
-                        # Registrar la transacción de venta
-                        Transaction.objects.create(
-                            amount=total_revenue,
-                            transactionType="ASSET_SELL",
-                            sourceAccount=user.account,
-                            transactionDate=timezone.now()
-                        )
-
-            except ValueError as e:
-                print(f"Error al obtener el precio de mercado para {asset.assetSymbol}: {e}")
-            except Exception as e:
-                print(f"Error inesperado al procesar {asset.assetSymbol} para el usuario {user.id}: {e}")
-
-        # Registrar la última ejecución del bot de inversión automática para este usuario
-        auto_invest.last_executed = timezone.now()
-        auto_invest.save()
\ No newline at end of file
+    """Reparte entre los workers la compra y venta automática de activos de todos los usuarios con auto-inversión activa."""
+
+    # Obtenemos los precios una sola vez para toda la ejecución
+    try:
+        prices = load_prices()
+    except PriceFeedError as e:
+        print(f"Error al obtener los precios de mercado: {e}")
+        return None
+
+    # Cada shard recibe el mismo snapshot de precios y la misma marca de inicio de ejecución
+    run_started = timezone.now().isoformat()
+    serialized_prices = {symbol: str(price) for symbol, price in prices.items()}
+    shard_count = settings.AUTO_INVEST_SHARDS
+    shards = group(
+        auto_invest_shard.s(shard, shard_count, serialized_prices, run_started)
+        for shard in range(shard_count)
+    )
+    chord(shards)(summarize_auto_invest_run.s(run_started))
+    return run_started
+
+
+@shared_task
+def auto_invest_shard(shard, shard_count, prices, run_started):
+    """Ejecuta el bot de auto-inversión para los usuarios cuyo id cae en el shard indicado."""
+    started = time.monotonic()
+    prices = {symbol: Decimal(price) for symbol, price in prices.items()}
+    summary = run_auto_invest(
+        triggered_user_ids(prices, shard, shard_count), prices, datetime.fromisoformat(run_started)
+    )
+    summary["shard"] = shard
+    summary["duration"] = round(time.monotonic() - started, 3)
+    return summary
+
+
+@shared_task
+def summarize_auto_invest_run(shard_summaries, run_started):
+    """Agrega los resultados de todos los shards de una ejecución del bot."""
+    summary = {
+        "run_started": run_started,
+        "users": sum(s["users"] for s in shard_summaries),
+        "trades": sum(s["trades"] for s in shard_summaries),
+        "failures": sum(s["failures"] for s in shard_summaries),
+        "shards": sorted(shard_summaries, key=lambda s: s["shard"]),
+    }
+    print(f"Auto-inversión {run_started}: {summary['users']} usuarios, "
+          f"{summary['trades']} operaciones, {summary['failures']} fallos")
+    return summary
+
+
+@shared_task
+def auto_invest_user(user_id):
+    """Evalúa las reglas del bot de auto-inversión solo para los activos de un usuario."""
+    try:
+        prices = load_prices()
+    except PriceFeedError as e:
+        print(f"Error al obtener los precios de mercado: {e}")
+        return None
+
+    return run_auto_invest([user_id], prices)
+
+
+@shared_task
+def bulk_transfer_task(account_id, legs):
+    """Ejecuta en segundo plano una transferencia masiva y devuelve el informe por tramo."""
+    source = BankAccount.objects.get(pk=account_id)
+    legs = [(number, Decimal(amount)) for number, amount in legs]
+    results = ledger.bulk_transfer(source, legs, settings.BULK_TRANSFER_CHUNK_SIZE)
+    return {"accountNumber": source.accountNumber, "results": results}
+
+
+@shared_task(ignore_result=True)
+def deliver_outbox():
+    """Envía los correos pendientes del outbox reutilizando una conexión SMTP por lote."""
+    summary = outbox.deliver_pending()
+    if summary["retried"] or summary["failed"]:
+        print(f"Outbox: {summary['sent']} enviados, {summary['retried']} reintentos, {summary['failed']} descartados")
+    return summary
+
+
+@shared_task(ignore_result=True)
+def revalue_users(user_ids):
+    """Recalcula la valoración materializada de los usuarios cuyos saldos o activos han cambiado."""
+    try:
+        valuation.recompute_valuations(user_ids)
+    except PriceFeedError as e:
+        print(f"Error al obtener los precios de mercado: {e}")
+
+
+@shared_task(ignore_result=True)
+def revalue_holders(symbols, snapshot=None):
+    """
+    Recalcula, con el snapshot publicado que ha cambiado los símbolos, la valoración de sus poseedores.
+    Las valoraciones ya calculadas con un snapshot posterior no se tocan.
+    """
+    try:
+        valuation.recompute_valuations(valuation.holders_of(symbols), snapshot)
+    except PriceFeedError as e:
+        print(f"Error al obtener los precios de mercado: {e}")
@@ -1,3 +1,388 @@
+import io
+import itertools
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from market.price_feed import PriceFeed
+from market.signals import prices_published
+from . import account_numbers, history, ledger, valuation
+from .auto_invest import triggered_q
+from .hashing import hashing_pool
+from .models import (
+    AccountNumberPool, CustomUser, OutboxEmail, PortfolioValuation, Subscription, Transaction, UserAsset,
+)
+from .subscriptions import process_due_subscriptions
+from .user_cache import user_cache
+from .views import TransactionExportView
 
-# Create your tests here.
+def create_user(email, balance=Decimal("0")):
+    """Crea un usuario con su cuenta (la crea la señal post_save) y el saldo indicado."""
+    user = CustomUser.objects.create(
+        name=email.split("@")[0], email=email, phoneNumber=email[:15], address="Calle 1", countryCode="ES",
+    )
+    user.account.balance = balance
+    user.account.save(update_fields=["balance"])
+    return user
+
+
+class UserAssetTriggerPriceTests(TestCase):
+    def setUp(self):
+        self.user = create_user("trigger@example.com")
+        self.asset = UserAsset.objects.create(
+            user=self.user, assetSymbol="GOLD", quantity=Decimal("1"), purchase_price=Decimal("100")
+        )
+
+    def test_update_recomputes_trigger_prices(self):
+        UserAsset.objects.filter(pk=self.asset.pk).update(purchase_price=Decimal("50"))
+        self.asset.refresh_from_db()
+        self.assertEqual(self.asset.buy_trigger_price, Decimal("40"))
+        self.assertEqual(self.asset.sell_trigger_price, Decimal("60"))
+
+    def test_bulk_update_recomputes_trigger_prices(self):
+        self.asset.purchase_price = Decimal("200")
+        UserAsset.objects.bulk_update([self.asset], ["purchase_price"])
+        self.asset.refresh_from_db()
+        self.assertEqual(self.asset.buy_trigger_price, Decimal("160"))
+        self.assertEqual(self.asset.sell_trigger_price, Decimal("240"))
+
+    def test_empty_holdings_are_not_triggered(self):
+        prices = {"GOLD": Decimal("10")}
+        self.assertTrue(UserAsset.objects.filter(triggered_q(prices)).exists())
+
+        UserAsset.objects.filter(pk=self.asset.pk).update(quantity=0)
+        self.assertFalse(UserAsset.objects.filter(triggered_q(prices)).exists())
+
+
+class SubscriptionDueScanTests(TestCase):
+    def setUp(self):
+        self.user = create_user("subscription@example.com", Decimal("100"))
+        self.now = timezone.now()
+
+    def test_only_due_subscriptions_are_charged(self):
+        due = Subscription.objects.create(
+            user=self.user, amount=Decimal("10"), interval_seconds=60, last_executed=self.now - timedelta(minutes=2)
+        )
+        Subscription.objects.create(
+            user=self.user, amount=Decimal("10"), interval_seconds=3600, last_executed=self.now
+        )
+
+        with self.captureOnCommitCallbacks(execute=False), mock.patch("users.tasks.revalue_users.delay"):
+            summary = process_due_subscriptions(now=self.now)
+
+        self.assertEqual(summary, {"charged": 1, "deactivated": 0})
+        self.user.account.refresh_from_db()
+        self.assertEqual(self.user.account.balance, Decimal("90"))
+        due.refresh_from_db()
+        self.assertEqual(due.next_run_at, self.now + timedelta(seconds=60))
+        self.assertEqual(Transaction.objects.filter(transactionType="SUBSCRIPTION").count(), 1)
+
+
+@mock.patch("users.tasks.revalue_users.delay")
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.alice = create_user("alice@example.com", Decimal("100"))
+        self.bob = create_user("bob@example.com", Decimal("0"))
+
+    def assertBalance(self, user, expected):
+        user.account.refresh_from_db()
+        self.assertEqual(user.account.balance, Decimal(expected))
+
+    def test_transfer_moves_money_and_records_transaction(self, delay):
+        ledger.transfer(self.alice.account, self.bob.account, Decimal("30"))
+
+        self.assertBalance(self.alice, "70")
+        self.assertBalance(self.bob, "30")
+        self.assertTrue(Transaction.objects.filter(
+            transactionType="CASH_TRANSFER", sourceAccount=self.alice.account, targetAccount=self.bob.account
+        ).exists())
+
+    def test_failed_transfer_rolls_back_credit(self, delay):
+        # bob tiene el pk mayor: el abono a alice se aplica antes del cargo fallido
+        with self.assertRaises(ledger.InsufficientFunds):
+            ledger.transfer(self.bob.account, self.alice.account, Decimal("1"))
+
+        self.assertBalance(self.alice, "100")
+        self.assertBalance(self.bob, "0")
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_sell_asset_locks_account_before_asset(self, delay):
+        UserAsset.objects.create(
+            user=self.alice, assetSymbol="GOLD", quantity=Decimal("2"), purchase_price=Decimal("10")
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            asset, total = ledger.sell_asset(self.alice, self.alice.account, "GOLD", Decimal("1"), Decimal("15"))
+
+        tables = [query["sql"] for query in queries.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertIn("users_bankaccount", tables[0])
+        self.assertIn("users_userasset", tables[1])
+        self.assertEqual(total, Decimal("15"))
+        self.assertEqual(asset.quantity, Decimal("1"))
+        self.assertBalance(self.alice, "115")
+
+    def test_sell_asset_rejects_oversell(self, delay):
+        UserAsset.objects.create(
+            user=self.alice, assetSymbol="GOLD", quantity=Decimal("1"), purchase_price=Decimal("10")
+        )
+
+        with self.assertRaises(ledger.InsufficientHoldings):
+            ledger.sell_asset(self.alice, self.alice.account, "GOLD", Decimal("2"), Decimal("15"))
+        self.assertBalance(self.alice, "100")
+
+
+@mock.patch("users.tasks.revalue_users.delay")
+class BulkTransferTests(TestCase):
+    def setUp(self):
+        self.source = create_user("source@example.com", Decimal("100"))
+        self.first = create_user("first@example.com")
+        self.second = create_user("second@example.com")
+
+    def test_chunks_settle_independently(self, delay):
+        legs = [
+            (self.first.accountNumber, Decimal("40")),
+            (self.second.accountNumber, Decimal("40")),
+            ("zzzzzz", Decimal("1")),
+            (self.first.accountNumber, Decimal("40")),
+        ]
+
+        results = ledger.bulk_transfer(self.source.account, legs, chunk_size=2)
+
+        self.assertEqual([r["status"] for r in results], ["completed", "completed", "failed", "failed"])
+        self.assertEqual(results[2]["detail"], "Target account not found")
+        self.assertEqual(results[3]["detail"], "Insufficient balance")
+        for user, balance in ((self.source, "20"), (self.first, "40"), (self.second, "40")):
+            user.account.refresh_from_db()
+            self.assertEqual(user.account.balance, Decimal(balance))
+        self.assertEqual(Transaction.objects.filter(transactionType="CASH_TRANSFER").count(), 2)
+
+
+class BulkTransferStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = create_user("owner@example.com")
+        self.other = create_user("other@example.com")
+        self.client = APIClient()
+        self.task_id = "3f1c0a52-0000-4000-8000-000000000000"
+        cache.set(f"bulk-transfer:owner:{self.task_id}", self.owner.pk)
+
+    def get_status(self, user, result):
+        self.client.force_authenticate(user)
+        with mock.patch("users.views.AsyncResult", return_value=result):
+            return self.client.get(f"/api/account/bulk-transfer/{self.task_id}")
+
+    def test_pending_task_of_another_user_is_not_found(self):
+        pending = mock.Mock(**{"ready.return_value": False, "status": "PENDING"})
+        self.assertEqual(self.get_status(self.other, pending).status_code, 404)
+        self.assertEqual(self.get_status(self.owner, pending).data, {"status": "PENDING"})
+
+    def test_unknown_task_is_not_found(self):
+        self.task_id = "unknown"
+        finished = mock.Mock(**{"ready.return_value": True, "failed.return_value": False, "result": 42})
+        self.assertEqual(self.get_status(self.owner, finished).status_code, 404)
+
+    def test_unexpected_result_shape_is_not_found(self):
+        finished = mock.Mock(**{"ready.return_value": True, "failed.return_value": False, "result": 42})
+        self.assertEqual(self.get_status(self.owner, finished).status_code, 404)
+
+    def test_owner_gets_report(self):
+        report = {"accountNumber": self.owner.accountNumber, "results": [{"status": "completed"}]}
+        finished = mock.Mock(**{"ready.return_value": True, "failed.return_value": False, "result": report,
+                                "status": "SUCCESS"})
+        response = self.get_status(self.owner, finished)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["completed"], 1)
+
+
+class TransactionExportTests(TestCase):
+    def setUp(self):
+        self.user = create_user("export@example.com")
+        now = timezone.now()
+        Transaction.objects.bulk_create([
+            Transaction(
+                amount=Decimal(i + 1), transactionType="CASH_DEPOSIT", sourceAccount=self.user.account,
+                transactionDate=now - timedelta(minutes=i),
+            )
+            for i in range(5)
+        ])
+
+    def export(self, export_format):
+        request = APIRequestFactory().get("/api/account/transactions/export", {"exportFormat": export_format})
+        force_authenticate(request, user=self.user)
+        return TransactionExportView.as_view()(request)
+
+    async def test_first_chunk_is_sent_before_the_last_batch_is_read(self):
+        fetch = mock.Mock(wraps=history._fetch_export_batch)
+        with mock.patch.object(history, "EXPORT_BATCH_SIZE", 2), mock.patch.object(history, "_fetch_export_batch", fetch):
+            response = await sync_to_async(self.export)("ndjson")
+            chunks = response.__aiter__()
+
+            first = await chunks.__anext__()
+            self.assertEqual(fetch.call_count, 1)
+            self.assertEqual(json.loads(first)["amount"], "1.00")
+
+            rest = [chunk async for chunk in chunks]
+
+        self.assertEqual(len(rest), 4)
+        self.assertEqual(fetch.call_count, 3)
+
+    async def test_csv_export_contains_every_row(self):
+        response = await sync_to_async(self.export)("csv")
+        lines = b"".join([chunk async for chunk in response]).decode().splitlines()
+        self.assertEqual(lines[0].split(","), history.EXPORT_FIELDS)
+        self.assertEqual(len(lines), 6)
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache._local.clear()
+        self.user = create_user("cache@example.com")
+
+    def test_stale_row_is_not_served_after_concurrent_invalidation(self):
+        cached, version = user_cache.get(self.user.pk)
+        self.assertIsNone(cached)
+        stale = CustomUser.objects.get(pk=self.user.pk)
+
+        # La invalidación se confirma entre la lectura de MySQL y el set
+        with self.captureOnCommitCallbacks(execute=True):
+            user_cache.invalidate(self.user.pk)
+        user_cache.set(stale, version)
+
+        cached, _ = user_cache.get(self.user.pk)
+        self.assertIsNone(cached)
+
+    def test_hit_returns_a_fresh_copy(self):
+        _, version = user_cache.get(self.user.pk)
+        user_cache.set(self.user, version)
+
+        first, _ = user_cache.get(self.user.pk)
+        first.name = "changed"
+        second, _ = user_cache.get(self.user.pk)
+        self.assertEqual(second.name, self.user.name)
+
+    def test_pin_change_does_not_write_back_cached_columns(self):
+        self.user.password = hashing_pool.make_password("Secret1!")
+        self.user.save()
+        client = APIClient()
+        cached = CustomUser.objects.get(pk=self.user.pk)
+        CustomUser.objects.filter(pk=self.user.pk).update(name="Renamed")
+
+        client.force_authenticate(cached)
+        response = client.post("/api/account/create-pin", {"pin": "1234", "password": "Secret1!"})
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, "Renamed")
+        self.assertTrue(hashing_pool.check_password("1234", self.user.encrypted_pin))
+
+
+def fake_uuids(*numbers):
+    """Sustituye uuid4 por una secuencia cíclica cuyos 6 primeros caracteres hex son `numbers`."""
+    values = itertools.cycle([mock.Mock(hex=number + "0" * 26) for number in numbers])
+    return mock.patch("users.account_numbers.uuid.uuid4", side_effect=lambda: next(values))
+
+
+class AccountNumberPoolTests(TestCase):
+    def test_refill_counts_only_inserted_numbers(self):
+        AccountNumberPool.objects.create(number="aaaaaa", claimed=True)
+        with fake_uuids("aaaaaa", "bbbbbb", "cccccc"):
+            added = account_numbers.refill_pool(2, batch_size=3)
+
+        self.assertEqual(added, 2)
+        self.assertEqual(
+            set(AccountNumberPool.objects.filter(claimed=False).values_list("number", flat=True)), {"bbbbbb", "cccccc"}
+        )
+
+    def test_refill_stops_when_no_new_numbers_can_be_found(self):
+        AccountNumberPool.objects.create(number="aaaaaa")
+        with fake_uuids("aaaaaa"), self.assertRaises(account_numbers.PoolExhausted):
+            account_numbers.refill_pool(2, batch_size=1, max_idle_batches=3)
+
+    def test_refill_rejects_targets_beyond_the_keyspace(self):
+        AccountNumberPool.objects.create(number="aaaaaa")
+        with mock.patch.object(account_numbers, "KEYSPACE", 2), self.assertRaises(account_numbers.PoolExhausted):
+            account_numbers.refill_pool(3)
+
+    def test_fallback_skips_numbers_waiting_in_the_pool(self):
+        account_numbers._numbers.clear()
+        AccountNumberPool.objects.create(number="aaaaaa", claimed=True)
+        with mock.patch.object(account_numbers, "claim_block", return_value=[]), fake_uuids("aaaaaa", "dddddd"):
+            self.assertEqual(account_numbers.allocate_account_number(), "dddddd")
+
+
+class PortfolioValuationTests(TestCase):
+    def setUp(self):
+        self.user = create_user("valuation@example.com", Decimal("100"))
+        UserAsset.objects.create(user=self.user, assetSymbol="GOLD", quantity=Decimal("2"), purchase_price=Decimal("10"))
+
+    def test_older_snapshot_does_not_overwrite_newer_valuation(self):
+        valuation.recompute_valuations([self.user.pk], {"version": 5, "prices": {"GOLD": 50}})
+        valuation.recompute_valuations([self.user.pk], {"version": 4, "prices": {"GOLD": 40}})
+
+        stored = PortfolioValuation.objects.get(user=self.user)
+        self.assertEqual(stored.price_version, 5)
+        self.assertEqual(stored.total, Decimal("200"))
+
+    def test_holders_are_revalued_with_the_published_snapshot(self):
+        stale = {"version": 1, "timestamp": 0, "prices": {"GOLD": 10}}
+        with mock.patch("market.price_feed.price_feed.get_snapshot", return_value=stale), \
+                mock.patch("market.price_feed.price_feed.latest_published", return_value=stale):
+            prices_published.send(
+                sender=PriceFeed, snapshot={"version": 2, "timestamp": 0, "prices": {"GOLD": 30}}, changed={"GOLD"}
+            )
+
+        stored = PortfolioValuation.objects.get(user=self.user)
+        self.assertEqual(stored.price_version, 2)
+        self.assertEqual(stored.total, Decimal("160"))
+
+    @mock.patch("users.tasks.revalue_users.delay")
+    def test_sale_email_reports_net_worth_after_the_sale(self, delay):
+        self.user.encrypted_pin = hashing_pool.make_password("1234")
+        self.user.save(update_fields=["encrypted_pin"])
+        # Valoración materializada anterior a la venta: solo se toman de ella los demás activos
+        PortfolioValuation.objects.create(
+            user=self.user, cash=Decimal("1"), assets={"GOLD": "20", "SILVER": "30"}, total=Decimal("51"), price_version=0
+        )
+        snapshot = {"version": 3, "timestamp": 0, "prices": {"GOLD": 25}}
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch("market.price_feed.price_feed.get_snapshot", return_value=snapshot), \
+                mock.patch("market.price_feed.price_feed.latest_published", return_value=snapshot):
+            with mock.patch.object(valuation, "recompute_valuations") as recompute:
+                response = client.post("/api/account/sell-asset", {"assetSymbol": "GOLD", "quantity": "1", "pin": "1234"})
+
+        self.assertEqual(response.status_code, 200)
+        recompute.assert_not_called()
+        # 100 + 25 de la venta en efectivo, 1 unidad restante a 25 y 30 de SILVER
+        self.assertIn("Net Worth: $180.00", OutboxEmail.objects.get().body)
+
+
+class ImportUsersTests(TestCase):
+    def test_emails_differing_only_in_case_are_duplicates(self):
+        hashed = hashing_pool.make_password("Secret1!")
+        rows = [
+            {"name": name, "email": email, "address": "Calle 1", "phoneNumber": phone, "hashedPassword": hashed}
+            for name, email, phone in [("foo", "foo@example.com", "600000001"), ("Foo", "FOO@example.com", "600000002")]
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "users.ndjson")
+            with open(path, "w") as f:
+                f.writelines(json.dumps(row) + "\n" for row in rows)
+            call_command("import_users", path, "--workers", "1", stdout=io.StringIO())
+            with open(f"{path}.rejects.ndjson") as f:
+                rejects = [json.loads(line) for line in f]
+
+        self.assertEqual(list(CustomUser.objects.values_list("email", flat=True)), ["foo@example.com"])
+        self.assertEqual([(reject["line"], reject["errors"]) for reject in rejects], [(2, ["Invalid email: FOO@example.com"])])
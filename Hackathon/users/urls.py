@@ -12,9 +12,13 @@ urlpatterns = [
     path('auth/password-reset', ResetPasswordView.as_view(), name='reset-password'),
     path('account/create-pin', CreatePINView.as_view(), name='create-pin'),
     path('account/update-pin', UpdatePINView.as_view(), name='update-pin'),
+    path('account/step-up', StepUpTokenView.as_view(), name='step-up'),
     path('account/deposit', DepositMoneyView.as_view(), name='account-deposit'),
     path('account/withdraw', WithdrawMoneyView.as_view(), name='account-withdraw'),
     path('account/fund-transfer', TransferFundsView.as_view(), name='fund-transfer'),
+    path('account/bulk-transfer', BulkTransferView.as_view(), name='bulk-transfer'),
+    path('account/bulk-transfer/<str:task_id>', BulkTransferStatusView.as_view(), name='bulk-transfer-status'),
+    path('account/transactions/export', TransactionExportView.as_view(), name='transaction-export'),
     path('account/transactions', TransactionHistoryView.as_view(), name='transaction-history'),
     path('account/buy-asset', BuyAssetView.as_view(), name='buy-asset'),
     path('account/sell-asset', SellAssetView.as_view(), name='sell-asset'),
@@ -0,0 +1,89 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+class UserCache:
+    """
+    Caché versionada de usuarios autenticados junto con su BankAccount.
+
+    - La versión de cada usuario vive en Redis (`auth:user-version:<id>`) y cambia en cada invalidación.
+    - El usuario serializado se guarda en Redis bajo (id, versión) y en un LRU local del proceso,
+      así que con la caché caliente una petición cuesta un GET de Redis y ninguna consulta a MySQL.
+    - Cada lectura devuelve una copia nueva, de modo que las vistas pueden modificarla sin afectar a otras.
+    - `get` devuelve también la versión leída y `set` guarda solo bajo esa versión: si una invalidación
+      llega mientras se lee la fila de MySQL, la entrada queda bajo la versión ya caducada y nunca se sirve.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Devuelve (usuario o None, versión); la versión debe pasarse a `set` si se carga el usuario de MySQL."""
+        version = self._version(user_id)
+        key = (user_id, version)
+
+        with self._lock:
+            data = self._local.get(key)
+            if data is not None:
+                self._local.move_to_end(key)
+
+        if data is None:
+            data = cache.get(self._user_key(user_id, version))
+            if data is None:
+                return None, version
+            self._store_local(key, data)
+
+        return pickle.loads(data), version
+
+    def set(self, user, version):
+        """Guarda el usuario bajo la versión obtenida con `get` antes de leerlo de MySQL."""
+        data = pickle.dumps(user)
+        cache.set(self._user_key(user.pk, version), data, timeout=self.timeout)
+        self._store_local((user.pk, version), data)
+
+    def invalidate(self, *user_ids):
+        """Invalida los usuarios indicados cuando se confirme la transacción en curso."""
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        if user_ids:
+            transaction.on_commit(lambda: self._bump_versions(user_ids))
+
+    def _bump_versions(self, user_ids):
+        # Versión basada en el reloj: nunca coincide con la de una entrada antigua aunque Redis pierda la clave
+        version = time.time_ns()
+        cache.set_many({self._version_key(user_id): version for user_id in user_ids}, timeout=None)
+
+    def _version(self, user_id):
+        version = cache.get(self._version_key(user_id))
+        if version is None:
+            cache.add(self._version_key(user_id), time.time_ns(), timeout=None)
+            version = cache.get(self._version_key(user_id))
+        return version
+
+    def _store_local(self, key, data):
+        with self._lock:
+            self._local[key] = data
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    @staticmethod
+    def _version_key(user_id):
+        return f"auth:user-version:{user_id}"
+
+    @staticmethod
+    def _user_key(user_id, version):
+        return f"auth:user:{user_id}:{version}"
+
+
+user_cache = UserCache(
+    max_entries=settings.AUTH_USER_CACHE_SIZE,
+    timeout=settings.AUTH_USER_CACHE_TIMEOUT,
+)
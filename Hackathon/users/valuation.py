@@ -0,0 +1,140 @@
+"""
+Valoración materializada del patrimonio (`PortfolioValuation`).
+
+La fila de cada usuario se recalcula en segundo plano cuando cambian sus saldos o activos
+(el ledger lo programa tras el commit) y cuando un nuevo snapshot de precios modifica
+algún símbolo que posee. Consultar el patrimonio es así una sola lectura por clave.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from market.price_feed import price_feed
+from .models import BankAccount, PortfolioValuation, UserAsset
+
+# Usuarios revaluados por cada transacción de base de datos
+CHUNK_SIZE = 500
+
+
+def build_valuation(user_id, cash, holdings, snapshot):
+    """Calcula en memoria la valoración de un usuario a partir de sus activos [(símbolo, cantidad)]."""
+    prices = snapshot["prices"]
+    values = {}
+    total = Decimal(cash)
+    for symbol, quantity in holdings:
+        if symbol not in prices:
+            continue
+        value = Decimal(str(prices[symbol])) * quantity
+        values[symbol] = str(value)
+        total += value
+
+    return PortfolioValuation(
+        user_id=user_id, cash=cash, assets=values, total=total, price_version=snapshot["version"]
+    )
+
+
+def current_snapshot():
+    """
+    Snapshot más reciente disponible: el último publicado en Redis o el del proceso si es más nuevo.
+    Evita revaluar con el snapshot local, que puede ir hasta MARKET_PRICES_TTL por detrás.
+    """
+    snapshot = price_feed.get_snapshot()
+    published = price_feed.latest_published()
+    if published is not None and published["version"] > snapshot["version"]:
+        return published
+    return snapshot
+
+
+def recompute_valuations(user_ids, snapshot=None):
+    """
+    Recalcula y guarda la valoración de los usuarios indicados. Devuelve {user_id: PortfolioValuation}.
+
+    Las filas se bloquean antes de escribir y no se sobrescriben las calculadas con un snapshot de precios
+    más nuevo que `snapshot`: una revaluación que llega tarde no deshace otra posterior.
+    """
+    snapshot = snapshot or current_snapshot()
+    user_ids = list(user_ids)
+    valuations = {}
+    now = timezone.now()
+
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        chunk = user_ids[start:start + CHUNK_SIZE]
+        with transaction.atomic():
+            cash = dict(BankAccount.objects.filter(user_id__in=chunk).values_list("user_id", "balance"))
+
+            # Todas las filas deben existir para poder bloquearlas; las nuevas nacen sin versión de precios
+            PortfolioValuation.objects.bulk_create(
+                [PortfolioValuation(user_id=user_id, price_version=-1) for user_id in cash], ignore_conflicts=True
+            )
+            stored = {
+                valuation.user_id: valuation
+                for valuation in PortfolioValuation.objects.select_for_update()
+                .filter(user_id__in=list(cash)).order_by("user_id")
+            }
+
+            holdings = {}
+            for user_id, symbol, quantity in UserAsset.objects.filter(user_id__in=chunk, quantity__gt=0).values_list(
+                "user_id", "assetSymbol", "quantity"
+            ):
+                holdings.setdefault(user_id, []).append((symbol, quantity))
+
+            chunk_valuations = []
+            for user_id, balance in cash.items():
+                current = stored[user_id]
+                if current.price_version > snapshot["version"]:
+                    continue
+                valuation = build_valuation(user_id, balance, holdings.get(user_id, []), snapshot)
+                valuation.pk = current.pk
+                valuation.updated_at = now
+                chunk_valuations.append(valuation)
+
+            PortfolioValuation.objects.bulk_update(
+                chunk_valuations, ["cash", "assets", "total", "price_version", "updated_at"]
+            )
+        valuations.update((valuation.user_id, valuation) for valuation in chunk_valuations)
+
+    return valuations
+
+
+def holders_of(symbols):
+    """Ids de los usuarios con posición abierta en alguno de los símbolos."""
+    return list(
+        UserAsset.objects.filter(assetSymbol__in=symbols, quantity__gt=0)
+        .order_by("user_id").values_list("user_id", flat=True).distinct()
+    )
+
+
+def schedule_revaluation(*user_ids):
+    """Programa, tras el commit de la transacción en curso, la revaluación de los usuarios."""
+    def enqueue():
+        from .tasks import revalue_users
+        revalue_users.delay(sorted(set(user_ids)))
+
+    if user_ids:
+        transaction.on_commit(enqueue)
+
+
+def net_worth(user):
+    """Patrimonio neto del usuario; si aún no tiene valoración materializada se calcula en el momento."""
+    total = PortfolioValuation.objects.filter(user_id=user.pk).values_list("total", flat=True).first()
+    if total is None:
+        valuation = recompute_valuations([user.pk]).get(user.pk)
+        total = valuation.total if valuation else Decimal(0)
+    return total
+
+
+def net_worth_after_trade(user, cash, asset, price):
+    """
+    Patrimonio justo después de operar con `asset` a `price`, sin recalcular la valoración:
+    el efectivo y la posición del activo salen de las filas ya bloqueadas por la operación y
+    el resto de activos de la valoración materializada, que la operación no ha cambiado.
+    """
+    stored = PortfolioValuation.objects.filter(user_id=user.pk).values_list("assets", flat=True).first()
+    if stored is None:
+        return net_worth(user)
+    others = sum((Decimal(value) for symbol, value in stored.items() if symbol != asset.assetSymbol), Decimal(0))
+    return cash + asset.quantity * price + others
+
+
+def top_net_worth(n):
+    """Los `n` usuarios con mayor patrimonio, recorriendo el índice de `total`."""
+    return PortfolioValuation.objects.select_related("user").order_by("-total")[:n]
@@ -8,13 +8,25 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import *
 from rest_framework.exceptions import ValidationError
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.contrib.auth.hashers import make_password
+from .hashing import hashing_pool
 import random
 import uuid
-import requests
 from decimal import Decimal, InvalidOperation
-from .tasks import process_subscriptions, auto_invest_bot
+from .dispatch import trigger_user_auto_invest
+from . import ledger, step_up, valuation
+from .outbox import enqueue_email
+from django.db import transaction
+from django.conf import settings
+from django.core.cache import cache
+from celery.result import AsyncResult
+from .tasks import bulk_transfer_task
+from .history import (
+    EXPORT_FIELDS, HistoryQueryError, filter_transactions, iter_export_rows, keyset_page, parse_page_size,
+)
+from django.http import StreamingHttpResponse
+import csv
+import json
+from market.price_feed import price_feed, PriceFeedError
 
 
 class UserRegistrationView(APIView):
@@ -56,7 +68,7 @@ class UserLoginView(APIView):
             )
 
         # Validar la contraseña
-        if not user.check_password(password):
+        if not hashing_pool.check_password(password, user.password):
             return Response(
                 {"detail": "Bad credentials"},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -137,15 +149,16 @@ class SendOTPView(APIView):
         otp = random.randint(100000, 999999)
         user.otp = otp
         user.otp_created_at = timezone.now()
-        user.save()
 
-        # Enviar OTP por correo
-        send_mail(
-            subject="Password Reset OTP",
-            message=f"OTP: {otp}",
-            from_email="no-reply@banking.com",
-            recipient_list=[user.email],
-        )
+        # Guardar el OTP y encolar el correo en la misma transacción
+        with transaction.atomic():
+            user.save()
+            enqueue_email(
+                subject="Password Reset OTP",
+                body=f"OTP: {otp}",
+                from_email="no-reply@banking.com",
+                recipients=[user.email],
+            )
 
         return Response({"message": f"OTP sent successfully to: {user.email}"}, status=status.HTTP_200_OK)
 
@@ -187,7 +200,7 @@ class ResetPasswordView(APIView):
             return Response({"detail": "Invalid reset token or identifier"}, status=status.HTTP_400_BAD_REQUEST)
 
         # Restablecer la contraseña
-        user.password = make_password(new_password)
+        user.password = hashing_pool.make_password(new_password)
         user.password_reset_token = None  # Limpiar el token de reinicio una vez usado
         user.save()
 
@@ -203,16 +216,16 @@ class CreatePINView(APIView):
         password = request.data.get("password")
 
         # Verificar la contraseña del usuario
-        if not user.check_password(password):
+        if not hashing_pool.check_password(password, user.password):
             return Response({"detail": "Incorrect password"}, status=status.HTTP_401_UNAUTHORIZED)
 
         # Verificar que el PIN no exista aún
         if user.encrypted_pin:
             return Response({"detail": "PIN already set. Use the update PIN option."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Establecer el PIN
-        user.set_pin(pin)
-        user.save()
+        # Establecer el PIN; solo se escribe esa columna para no devolver a MySQL datos del usuario en caché
+        user.encrypted_pin = hashing_pool.make_password(pin)
+        user.save(update_fields=["encrypted_pin"])
         return Response({"msg": "PIN created successfully"}, status=status.HTTP_200_OK)
 
 
@@ -226,19 +239,37 @@ class UpdatePINView(APIView):
         new_pin = request.data.get("newPin")
 
         # Verificar la contraseña del usuario
-        if not user.check_password(password):
+        if not hashing_pool.check_password(password, user.password):
             return Response({"detail": "Incorrect password"}, status=status.HTTP_401_UNAUTHORIZED)
 
         # Verificar el PIN actual
-        if not user.check_pin(old_pin):
+        if not hashing_pool.check_password(old_pin, user.encrypted_pin):
             return Response({"detail": "Incorrect old PIN"}, status=status.HTTP_401_UNAUTHORIZED)
 
-        # Actualizar el PIN
-        user.set_pin(new_pin)
-        user.save()
+        # Actualizar el PIN; solo se escribe esa columna para no devolver a MySQL datos del usuario en caché
+        user.encrypted_pin = hashing_pool.make_password(new_pin)
+        user.save(update_fields=["encrypted_pin"])
         return Response({"msg": "PIN updated successfully"}, status=status.HTTP_200_OK)
 
 
+class StepUpTokenView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = StepUpTokenSerializer(data=request.data)
+
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Verificar el PIN una sola vez para toda la sesión de operaciones
+        user = request.user
+        if not hashing_pool.check_password(serializer.validated_data['pin'], user.encrypted_pin):
+            return Response({"detail": "Invalid PIN"}, status=status.HTTP_403_FORBIDDEN)
+
+        token, expires_in = step_up.issue_token(user, serializer.validated_data['operations'])
+        return Response({"stepUpToken": token, "expiresIn": expires_in}, status=status.HTTP_200_OK)
+
+
 class DepositMoneyView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -250,26 +281,15 @@ class DepositMoneyView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         # Extraer los datos validados
-        pin = serializer.validated_data['pin']
         amount = serializer.validated_data['amount']
 
         # Verificar que el PIN sea correcto
         user = request.user
-        if not user.check_pin(pin):
+        if not step_up.authorize(user, serializer.validated_data, "deposit"):
             return Response({"detail": "Invalid PIN"}, status=status.HTTP_403_FORBIDDEN)
 
-        # Procesar el depósito
-        user.account.balance += amount
-        user.account.save()
-
-        # Crear la transacción de depósito
-        Transaction.objects.create(
-            amount=amount,
-            transactionType="CASH_DEPOSIT",
-            sourceAccount=user.account,
-            targetAccount=None,
-            transactionDate=timezone.now()
-        )
+        # Procesar el depósito y registrar la transacción
+        ledger.deposit(user.account, amount)
 
         return Response({"msg": "Cash deposited successfully"}, status=status.HTTP_200_OK)
 
@@ -284,25 +304,20 @@ class WithdrawMoneyView(APIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        pin = serializer.validated_data['pin']
         amount = serializer.validated_data['amount']
         user = request.user
 
         # Validar el PIN y el saldo
-        if not user.check_pin(pin):
+        if not step_up.authorize(user, serializer.validated_data, "withdraw"):
             return Response({"msg": "Invalid PIN"}, status=status.HTTP_403_FORBIDDEN)
         if user.account.balance < amount:
             return Response({"msg": "Insufficient balance"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Realizar el retiro y actualizar la transacción
-        user.account.balance -= amount
-        user.account.save()
-
-        Transaction.objects.create(
-            amount=amount,
-            transactionType="CASH_WITHDRAWAL",
-            sourceAccount=user.account,
-        )
+        # Realizar el retiro y registrar la transacción
+        try:
+            ledger.withdraw(user.account, amount)
+        except ledger.InsufficientFunds:
+            return Response({"msg": "Insufficient balance"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({"msg": "Cash withdrawn successfully"}, status=status.HTTP_200_OK)
 
@@ -318,12 +333,11 @@ class TransferFundsView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         amount = serializer.validated_data['amount']
-        pin = serializer.validated_data['pin']
         targetAccount_number = serializer.validated_data['targetAccountNumber']
         user = request.user
 
         # Validación de PIN y balance
-        if not user.check_pin(pin):
+        if not step_up.authorize(user, serializer.validated_data, "transfer"):
             return Response({"msg": "Invalid PIN"}, status=status.HTTP_403_FORBIDDEN)
         if user.account.balance < amount:
             return Response({"msg": "Insufficient balance"}, status=status.HTTP_400_BAD_REQUEST)
@@ -335,33 +349,147 @@ class TransferFundsView(APIView):
         except BankAccount.DoesNotExist:
             return Response({"msg": "Target account not found"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Realizar la transferencia
-        user.account.balance -= amount
-        targetAccount.balance += amount
-        user.account.save()
-        targetAccount.save()
-
-        # Registrar la transacción
-        Transaction.objects.create(
-            amount=amount,
-            transactionType="CASH_TRANSFER",
-            sourceAccount=user.account,
-            targetAccount=targetAccount,
-        )
+        # Realizar la transferencia y registrar la transacción
+        try:
+            ledger.transfer(user.account, targetAccount, amount)
+        except ledger.InsufficientFunds:
+            return Response({"msg": "Insufficient balance"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({"msg": "Fund transferred successfully"}, status=status.HTTP_200_OK)
 
 
+def _bulk_transfer_owner_key(task_id):
+    return f"bulk-transfer:owner:{task_id}"
+
+
+def _bulk_transfer_report(results):
+    completed = sum(1 for result in results if result["status"] == "completed")
+    return {"completed": completed, "failed": len(results) - completed, "results": results}
+
+
+class BulkTransferView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkTransferSerializer(data=request.data)
+
+        # Validar los datos con el serializer
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        legs = [(leg['targetAccountNumber'], leg['amount']) for leg in serializer.validated_data['transfers']]
+        user = request.user
+
+        # Una única verificación de PIN para todo el lote
+        if not step_up.authorize(user, serializer.validated_data, "bulk_transfer"):
+            return Response({"msg": "Invalid PIN"}, status=status.HTTP_403_FORBIDDEN)
+
+        # Los lotes grandes se procesan en segundo plano
+        if len(legs) > settings.BULK_TRANSFER_SYNC_LIMIT:
+            # El titular se registra antes de encolar: el estado solo se muestra a quien lanzó el lote
+            task_id = str(uuid.uuid4())
+            cache.set(_bulk_transfer_owner_key(task_id), user.pk, timeout=settings.BULK_TRANSFER_STATUS_TTL)
+            bulk_transfer_task.apply_async(
+                args=(user.account.pk, [(number, str(amount)) for number, amount in legs]), task_id=task_id
+            )
+            return Response({"msg": "Bulk transfer accepted", "taskId": task_id}, status=status.HTTP_202_ACCEPTED)
+
+        results = ledger.bulk_transfer(user.account, legs, settings.BULK_TRANSFER_CHUNK_SIZE)
+        return Response(_bulk_transfer_report(results), status=status.HTTP_200_OK)
+
+
+class BulkTransferStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, task_id):
+        # Cualquier id que no sea una transferencia masiva del usuario es un 404, esté en el estado que esté
+        not_found = Response({"detail": "Bulk transfer not found"}, status=status.HTTP_404_NOT_FOUND)
+        if cache.get(_bulk_transfer_owner_key(task_id)) != request.user.pk:
+            return not_found
+
+        result = AsyncResult(task_id)
+        if not result.ready():
+            return Response({"status": result.status}, status=status.HTTP_200_OK)
+        if result.failed():
+            return Response({"status": result.status}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        data = result.result
+        if not isinstance(data, dict) or data.get("accountNumber") != request.user.accountNumber or "results" not in data:
+            return not_found
+        return Response({"status": result.status, **_bulk_transfer_report(data["results"])}, status=status.HTTP_200_OK)
+
+
 class TransactionHistoryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        transactions = Transaction.objects.filter(
-            sourceAccount=request.user.account
-        ).order_by("-transactionDate")
+        params = request.query_params
+        try:
+            transactions = filter_transactions(request.user.account, params)
+            page_size = parse_page_size(params.get("limit"))
+            rows, next_cursor = keyset_page(transactions, params.get("cursor"), page_size)
+        except HistoryQueryError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = TransactionSerializer(rows, many=True)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+
+        # El cuerpo sigue siendo una lista; la siguiente página se indica en las cabeceras
+        if next_cursor:
+            next_params = params.copy()
+            next_params["cursor"] = next_cursor
+            response["X-Next-Cursor"] = next_cursor
+            response["Link"] = f'<{request.build_absolute_uri("?" + next_params.urlencode())}>; rel="next"'
+        return response
+
+
+class _Echo:
+    """Objeto tipo fichero que devuelve lo escrito, para generar CSV línea a línea."""
 
-        serializer = TransactionSerializer(transactions, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    def write(self, value):
+        return value
+
+
+async def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    async for row in rows:
+        yield writer.writerow(row)
+
+
+async def _ndjson_lines(rows):
+    async for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n"
+
+
+class TransactionExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        export_format = params.get("exportFormat", "csv")
+        if export_format not in ("csv", "ndjson"):
+            return Response({"detail": "Invalid 'exportFormat', expected csv or ndjson"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            transactions = filter_transactions(request.user.account, params)
+        except HistoryQueryError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = iter_export_rows(transactions)
+        if export_format == "csv":
+            content = _csv_lines(rows)
+            content_type = "text/csv"
+        else:
+            content = _ndjson_lines(rows)
+            content_type = "application/x-ndjson"
+
+        # Contenido asíncrono: con ASGI cada lote se envía en cuanto se lee de la base de datos
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="transactions-{request.user.accountNumber}.{export_format}"'
+        )
+        return response
 
 
 class BuyAssetView(APIView):
@@ -374,73 +502,41 @@ class BuyAssetView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         user = request.user
-        pin = serializer.validated_data['pin']
         amount = serializer.validated_data['amount']
         assetSymbol = serializer.validated_data['assetSymbol']
 
         # Validar el PIN
-        if not user.check_pin(pin):
+        if not step_up.authorize(user, serializer.validated_data, "buy"):
             return Response({"detail": "Invalid PIN"}, status=status.HTTP_403_FORBIDDEN)
 
         # Consultar el precio en tiempo real del activo
         try:
-            response = requests.get(
-                "https://faas-lon1-917a94a7.doserverless.co/api/v1/web/fn-e0f31110-7521-4cb9-86a2-645f66eefb63/default/market-prices-simulator"
-            )
-            response.raise_for_status()
-            prices = response.json()
-            current_price = prices.get(assetSymbol)
+            current_price = price_feed.get_price(assetSymbol)
 
             if current_price is None:
                 return Response({"detail": "Asset not available in market data"}, status=status.HTTP_400_BAD_REQUEST)
 
             # Convertir el precio a Decimal, manejando errores potenciales
             current_price = Decimal(current_price)
-        except (requests.RequestException, InvalidOperation) as e:
+        except (PriceFeedError, InvalidOperation) as e:
             return Response(
                 {"detail": "Failed to retrieve asset price or invalid price format"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-        # Calcular la cantidad del activo a comprar
-        quantity = amount / current_price
-
         # Verificar si hay saldo suficiente
         if user.account.balance < amount:
             return Response({"detail": "Insufficient balance"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Realizar la compra del activo
-        user.account.balance -= amount
-        user.account.save()
-
-        # Obtener o crear el registro del activo del usuario
-        user_asset, created = UserAsset.objects.get_or_create(
-            user=user,
-            assetSymbol=assetSymbol,
-            defaults={'quantity': quantity, 'purchase_price': current_price}
-        )
-
-        if not created:
-            # Si ya existe, actualizar la cantidad y ajustar el precio promedio de compra
-            new_quantity = user_asset.quantity + quantity
-            user_asset.purchase_price = (
-                (user_asset.purchase_price * user_asset.quantity) +
-                (current_price * quantity)
-            ) / new_quantity
-            user_asset.quantity = new_quantity
-            user_asset.save()
-
-        # Registrar la transacción
-        Transaction.objects.create(
-            amount=amount,
-            transactionType="ASSET_PURCHASE",
-            sourceAccount=user.account,
-            transactionDate=timezone.now(),
-        )
+        # Realizar la compra del activo, registrar la transacción y encolar el correo de confirmación
+        try:
+            with transaction.atomic():
+                user_asset, quantity = ledger.buy_asset(user, user.account, assetSymbol, amount, current_price)
+                user.account.refresh_from_db(fields=["balance"])
 
-        # Preparar el contenido del correo electrónico
-        asset_summary = f"{assetSymbol}: {user_asset.quantity} units purchased at ${user_asset.purchase_price:.2f}"
-        email_message = f"""Dear {user.name},
+                # Preparar el contenido del correo electrónico
+                asset_summary = f"{assetSymbol}: {user_asset.quantity} units purchased at ${user_asset.purchase_price:.2f}"
+                email_message = f"""Dear {user.name},
 
             You have successfully purchased {quantity:.2f} units of {assetSymbol} for a total amount of ${amount}.
 
@@ -458,13 +554,14 @@ class BuyAssetView(APIView):
             Investment Management Team
             """
 
-        # Enviar el correo de confirmación
-        send_mail(
-            subject="Investment Purchase Confirmation",
-            message=email_message,
-            from_email="no-reply@banking.com",
-            recipient_list=[user.email]
-        )
+                enqueue_email(
+                    subject="Investment Purchase Confirmation",
+                    body=email_message,
+                    from_email="no-reply@banking.com",
+                    recipients=[user.email],
+                )
+        except ledger.InsufficientFunds:
+            return Response({"detail": "Insufficient balance"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({"msg": "Asset purchase successful"}, status=status.HTTP_200_OK)
 
@@ -479,12 +576,11 @@ class SellAssetView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
         user = request.user
-        pin = serializer.validated_data['pin']
         quantity = serializer.validated_data['quantity']
         assetSymbol = serializer.validated_data['assetSymbol']
 
         # Verificar el PIN
-        if not user.check_pin(pin):
+        if not step_up.authorize(user, serializer.validated_data, "sell"):
             return Response({"detail": "Invalid PIN"}, status=status.HTTP_403_FORBIDDEN)
 
         # Verificar que el usuario tiene el activo y la cantidad suficiente
@@ -498,53 +594,49 @@ class SellAssetView(APIView):
 
         # Obtener el precio de venta actual desde la API de precios en tiempo real
         try:
-            response = requests.get(
-                "https://faas-lon1-917a94a7.doserverless.co/api/v1/web/fn-e0f31110-7521-4cb9-86a2-645f66eefb63/default/market-prices-simulator")
-            response.raise_for_status()
-            market_data = response.json()
-            asset_sale_price = Decimal(market_data.get(assetSymbol))
+            asset_sale_price = price_feed.get_price(assetSymbol)
             if asset_sale_price is None:
                 return Response({"detail": "Asset price not found"}, status=status.HTTP_400_BAD_REQUEST)
-        except requests.RequestException as e:
+            asset_sale_price = Decimal(asset_sale_price)
+        except PriceFeedError as e:
             return Response({"detail": "Error fetching real-time asset price"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        # Calcular el valor total de la venta y la ganancia/pérdida
-        total_sale_value = Decimal(quantity) * asset_sale_price
-        gain_loss = (asset_sale_price - user_asset.purchase_price) * quantity
-
-        # Actualizar la cuenta del usuario y la cantidad del activo
-        user.account.balance += total_sale_value
-        user.account.save()
-        user_asset.quantity -= quantity
-        user_asset.save()
-
-        # Crear la transacción
-        Transaction.objects.create(
-            amount=total_sale_value,
-            transactionType="ASSET_SELL",
-            sourceAccount=user.account,
-            transactionDate=timezone.now(),
-        )
-
-        # Enviar correo de confirmación
-        send_mail(
-            subject="Investment Sale Confirmation",
-            message=(
-                f"Dear {user.name},\n\n"
-                f"You have successfully sold {quantity} units of {assetSymbol}.\n\n"
-                f"Total Gain/Loss: ${gain_loss:.2f}\n\n"
-                f"Remaining holdings of {assetSymbol}: {user_asset.quantity} units\n\n"
-                f"Summary of current assets:\n"
-                f"- {assetSymbol}: {user_asset.quantity} units purchased at ${user_asset.purchase_price}\n\n"
-                f"Account Balance: ${user.account.balance}\n"
-                f"Net Worth: ${user.account.balance + sum(asset.quantity * asset.purchase_price for asset in user.assets.all())}\n\n"
-                "Thank you for using our investment services.\n\n"
-                "Best Regards,\n"
-                "Investment Management Team"
-            ),
-            from_email="no-reply@investment.com",
-            recipient_list=[user.email],
-        )
+        # Actualizar la cuenta del usuario y la cantidad del activo, crear la transacción y encolar el correo
+        try:
+            with transaction.atomic():
+                user_asset, total_sale_value = ledger.sell_asset(
+                    user, user.account, assetSymbol, quantity, asset_sale_price
+                )
+                user.account.refresh_from_db(fields=["balance"])
+
+                # Calcular la ganancia/pérdida
+                gain_loss = (asset_sale_price - user_asset.purchase_price) * quantity
+
+                # Patrimonio tras la venta a partir del saldo y la posición ya actualizados en esta transacción
+                net_worth = valuation.net_worth_after_trade(
+                    user, user.account.balance, user_asset, asset_sale_price
+                )
+
+                enqueue_email(
+                    subject="Investment Sale Confirmation",
+                    body=(
+                        f"Dear {user.name},\n\n"
+                        f"You have successfully sold {quantity} units of {assetSymbol}.\n\n"
+                        f"Total Gain/Loss: ${gain_loss:.2f}\n\n"
+                        f"Remaining holdings of {assetSymbol}: {user_asset.quantity} units\n\n"
+                        f"Summary of current assets:\n"
+                        f"- {assetSymbol}: {user_asset.quantity} units purchased at ${user_asset.purchase_price}\n\n"
+                        f"Account Balance: ${user.account.balance}\n"
+                        f"Net Worth: ${net_worth:.2f}\n\n"
+                        "Thank you for using our investment services.\n\n"
+                        "Best Regards,\n"
+                        "Investment Management Team"
+                    ),
+                    from_email="no-reply@investment.com",
+                    recipients=[user.email],
+                )
+        except (UserAsset.DoesNotExist, ledger.InsufficientHoldings):
+            return Response({"detail": f"No holdings found for asset {assetSymbol}"}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({"msg": "Asset sold successfully"}, status=status.HTTP_200_OK)
 
@@ -580,33 +672,12 @@ class NetWorthView(APIView):
     def get(self, request):
         user = request.user
 
-        # Obtener el balance en efectivo del usuario
-        cash_balance = user.account.balance
-
-        # Obtener la lista de activos del usuario
-        user_assets = UserAsset.objects.filter(user=user)
-
-        # Obtener precios de activos en tiempo real
-        response = requests.get(
-            "https://faas-lon1-917a94a7.doserverless.co/api/v1/web/fn-e0f31110-7521-4cb9-86a2-645f66eefb63/default/market-prices-simulator")
-
-        if response.status_code != 200:
+        # Lectura de la valoración materializada; solo se calcula si el usuario aún no tiene
+        try:
+            net_worth = valuation.net_worth(user)
+        except PriceFeedError:
             return Response({"detail": "Error retrieving market prices"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        market_prices = response.json()
-
-        # Calcular el valor total de los activos en posesión
-        total_asset_value = Decimal(0)
-        for asset in user_assets:
-            asset_symbol = asset.assetSymbol
-            if asset_symbol in market_prices:
-                current_price = Decimal(market_prices[asset_symbol])
-                asset_value = current_price * asset.quantity
-                total_asset_value += asset_value
-
-        # Calcular el patrimonio neto
-        net_worth = cash_balance + total_asset_value
-
         return Response({"netWorth": float(net_worth)}, status=status.HTTP_200_OK)
 
 
@@ -622,40 +693,28 @@ class CreateSubscriptionView(APIView):
 
         amount = serializer.validated_data['amount']
         interval_seconds = serializer.validated_data['intervalSeconds']
-        pin = serializer.validated_data['pin']
         user = request.user
 
-        # Verificar el PIN
-        if not user.check_pin(pin):
-            return Response({"detail": "Invalid PIN"}, status=status.HTTP_403_FORBIDDEN)
-
+        # El PIN (o el token de step-up) ya lo ha verificado el serializer
         # Verificar saldo del usuario
         if user.account.balance < amount:
             return Response({"detail": "Insufficient balance"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Crear suscripción
-        subscription = Subscription.objects.create(
-            user=user,
-            amount=amount,
-            interval_seconds=interval_seconds,
-            last_executed=timezone.now(),
-            is_active=True
-        )
-
-        # Registrar la primera transacción de prueba
-        user.account.balance -= amount
-        user.account.save()
-
-        Transaction.objects.create(
-            amount=amount,
-            transactionType="SUBSCRIPTION",
-            sourceAccount=user.account,
-            transactionDate=timezone.now(),
-        )
-
-        # Llamada a Celery para procesar suscripciones periódicamente
-        process_subscriptions.delay()
+        # Crear suscripción y registrar la primera transacción
+        try:
+            with transaction.atomic():
+                Subscription.objects.create(
+                    user=user,
+                    amount=amount,
+                    interval_seconds=interval_seconds,
+                    last_executed=timezone.now(),
+                    is_active=True
+                )
+                ledger.withdraw(user.account, amount, "SUBSCRIPTION")
+        except ledger.InsufficientFunds:
+            return Response({"detail": "Insufficient balance"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # El siguiente cobro lo liquida la pasada periódica de suscripciones vencidas (next_run_at)
         return Response({"msg": "Subscription created successfully"}, status=status.HTTP_201_CREATED)
 
 
@@ -674,8 +733,8 @@ class EnableAutoInvestView(APIView):
             auto_invest.is_active = True
             auto_invest.save()
 
-            # Programar la tarea de auto-inversión global para todos los usuarios con auto-inversión activa
-            auto_invest_bot.apply_async(countdown=0)
+            # Evaluar solo los activos de este usuario (el bot global lo ejecuta Celery beat)
+            trigger_user_auto_invest(user.id)
 
             # Respuesta de éxito
             return Response({"msg": "Automatic investment enabled successfully"}, status=status.HTTP_200_OK)
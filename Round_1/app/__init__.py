@@ -28,5 +28,9 @@ def create_app(config_class=Config):
     app.register_blueprint(transfers_bp)
     app.register_blueprint(alerts_bp)
     app.register_blueprint(transactions_bp)
-    
+
+    # Registrar comandos de la CLI (flask <comando>)
+    from .cli import register_commands
+    register_commands(app)
+
     return app
@@ -0,0 +1,68 @@
+from flask import current_app
+import click
+import json
+import time
+from .extensions import db
+from .services.backtest import backtest, parse_rules
+from .services.mail import process_alert_jobs
+
+
+@click.command('fraud-backtest')
+@click.option('--rules', 'rule_specs', multiple=True,
+              help="Juego de reglas, p. ej. 'sigma=2.5,average_days=60,category_days=180,rapid_minutes=5,rapid_count=3'. "
+                   "Se puede repetir; sin ninguno se usan las reglas actuales.")
+@click.option('--file', 'path', type=click.Path(exists=True, dir_okay=False),
+              help="CSV exportado (user_id,amount,category,timestamp,fraud) ordenado por user_id y timestamp. "
+                   "Por defecto se lee la tabla de transacciones.")
+@click.option('--workers', default=1, show_default=True, help="Procesos; cada uno evalúa un shard de usuarios.")
+@click.option('--chunk-size', default=10000, show_default=True, help="Filas leídas por bloque de la base de datos.")
+@click.option('--json', 'as_json', is_flag=True, help="Salida en JSON.")
+def fraud_backtest_command(rule_specs, path, workers, chunk_size, as_json):
+    """Reproduce las reglas de fraude sobre el historial y compara con la columna fraud."""
+    try:
+        rule_sets = [parse_rules(spec) for spec in rule_specs] or [parse_rules("")]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--rules")
+
+    report = backtest(rule_sets, path=path, workers=workers, chunk_size=chunk_size,
+                      database_uri=current_app.config['SQLALCHEMY_DATABASE_URI'])
+
+    if as_json:
+        for result, spec in zip(report, rule_specs or ("",)):
+            result["rules"] = spec or "default"
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    click.echo(f"{'rules':<40} {'rows':>10} {'flag rate':>9} {'tp':>8} {'fp':>8} {'fn':>8} {'tn':>10} "
+               f"{'precision':>9} {'recall':>7}")
+    for result, spec in zip(report, rule_specs or ("",)):
+        click.echo(f"{spec or 'default':<40} {result['rows']:>10} {result['flag_rate']:>9.4f} {result['tp']:>8} {result['fp']:>8} "
+                   f"{result['fn']:>8} {result['tn']:>10} {result['precision']:>9.4f} {result['recall']:>7.4f}")
+
+
+@click.command('alerts-worker')
+@click.option('--once', is_flag=True, help="Procesa los trabajos pendientes y termina.")
+def alerts_worker_command(once):
+    """Evalúa las alertas encoladas por las transacciones y envía los emails."""
+    config = current_app.config
+    click.echo("Worker de alertas iniciado.")
+    while True:
+        try:
+            processed = process_alert_jobs(config)
+        except Exception as e:
+            # Un error de base de datos no debe detener el worker
+            db.session.rollback()
+            click.echo(f"Error procesando alertas: {e}", err=True)
+            processed = 0
+
+        if processed:
+            click.echo(f"Procesadas {processed} evaluaciones de alertas.")
+            continue
+        if once:
+            break
+        time.sleep(config['ALERT_POLL_INTERVAL'])
+
+
+def register_commands(app):
+    app.cli.add_command(fraud_backtest_command)
+    app.cli.add_command(alerts_worker_command)
@@ -22,4 +22,19 @@ class Config:
     MAIL_USE_SSL = False
     MAIL_USERNAME = ''
     MAIL_PASSWORD = ''
-    MAIL_DEFAULT_SENDER = 'noreply@company.com'
\ No newline at end of file
+    MAIL_DEFAULT_SENDER = 'noreply@company.com'
+
+    # Ingesta masiva de transacciones
+    BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', 200000))
+    # Usuarios (procesadores de tarjetas) que pueden enviar transacciones de otros usuarios
+    BATCH_PROCESSOR_USER_IDS = {
+        int(user_id) for user_id in os.environ.get('BATCH_PROCESSOR_USER_IDS', '').split(',') if user_id.strip()
+    }
+
+    # Worker de alertas (flask alerts-worker)
+    ALERT_COOLDOWN_SECONDS = int(os.environ.get('ALERT_COOLDOWN_SECONDS', 3600))  # Espera mínima entre avisos de una alerta
+    ALERT_JOB_BATCH_SIZE = int(os.environ.get('ALERT_JOB_BATCH_SIZE', 100))
+    ALERT_JOB_MAX_ATTEMPTS = int(os.environ.get('ALERT_JOB_MAX_ATTEMPTS', 5))
+    ALERT_RETRY_BACKOFF = int(os.environ.get('ALERT_RETRY_BACKOFF', 30))  # Segundos, se duplica en cada reintento
+    ALERT_CLAIM_TIMEOUT = int(os.environ.get('ALERT_CLAIM_TIMEOUT', 300))  # Segundos tras los que se recupera un trabajo reclamado por un worker caído
+    ALERT_POLL_INTERVAL = float(os.environ.get('ALERT_POLL_INTERVAL', 2))
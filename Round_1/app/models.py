@@ -24,6 +24,7 @@ class Alert(db.Model):
     target_amount = db.Column(db.Float, nullable=True)
     alert_threshold = db.Column(db.Float, nullable=True)
     balance_drop_threshold = db.Column(db.Float, nullable=True)
+    last_notified_at = db.Column(db.DateTime, nullable=True)  # Último aviso enviado, para el periodo de espera
 
     def to_dict(self):
         return {
@@ -35,6 +36,24 @@ class Alert(db.Model):
             "balance_drop_threshold": self.balance_drop_threshold
         }
 
+class AlertJob(db.Model):
+    """Evaluación pendiente de las alertas de un usuario, procesada por `flask alerts-worker`."""
+    __tablename__ = 'alert_job'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # 'pending', 'processing', 'done' o 'failed'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+
+    __table_args__ = (
+        db.Index('ix_alert_job_status_next_attempt_at', 'status', 'next_attempt_at'),
+        # Búsqueda (y bloqueo) del trabajo pendiente de un usuario al encolar
+        db.Index('ix_alert_job_user_id_status', 'user_id', 'status'),
+    )
+
+
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -43,6 +62,40 @@ class Transaction(db.Model):
     timestamp = db.Column(db.DateTime, default=db.func.now())
     fraud = db.Column(db.Boolean, default=False)
 
+    # Índice para las consultas de historial por usuario y rango de fechas de las reglas de fraude
+    __table_args__ = (
+        db.Index('ix_transaction_user_id_timestamp', 'user_id', 'timestamp'),
+    )
+
+
+class FraudState(db.Model):
+    """Estado incremental de las reglas de fraude de un usuario."""
+    __tablename__ = 'fraud_state'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    first_seen = db.Column(db.DateTime, nullable=True)      # Primera transacción registrada en el estado
+    last_timestamp = db.Column(db.DateTime, nullable=True)  # Transacción más reciente
+    recent = db.Column(db.JSON, default=list)               # Búfer circular [[timestamp ISO, amount], ...]
+
+
+class FraudDailyBucket(db.Model):
+    """Agregado diario de importes (Welford: count, mean, M2) para la regla de desviación."""
+    __tablename__ = 'fraud_daily_bucket'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    mean = db.Column(db.Float, nullable=False, default=0.0)
+    m2 = db.Column(db.Float, nullable=False, default=0.0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    first_timestamp = db.Column(db.DateTime, nullable=True)
+
+
+class FraudCategorySeen(db.Model):
+    """Última vez que el usuario gastó en cada categoría."""
+    __tablename__ = 'fraud_category_seen'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    category = db.Column(db.String(100), primary_key=True)
+    last_seen = db.Column(db.DateTime, nullable=False)
+
 
 class RecurringExpense(db.Model):
     __tablename__ = 'recurring_expenses'  # Especificar nombre de la tabla si es necesario
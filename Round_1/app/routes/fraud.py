@@ -1,10 +1,14 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from ..extensions import db
 from ..models import User, Transaction
-from datetime import datetime, timedelta
-import statistics
-from ..services.mail import check_and_notify_alerts
+from datetime import datetime, timezone
+from ..services.mail import enqueue_alert_check
+from ..services.fraud import check_fraud
+from ..services.fraud_batch import ingest
+import codecs
+import csv
+import json
 
 transactions_bp = Blueprint(
     'transactions', __name__, url_prefix='/api/transactions')
@@ -63,61 +67,17 @@ def add_transaction():
                 timestamp_str.replace("Z", "+00:00"))
         except ValueError:
             return jsonify({"msg": "Invalid timestamp format."}), 400
+        # Las fechas se guardan sin zona horaria, en UTC
+        if tx_time.tzinfo is not None:
+            tx_time = tx_time.astimezone(timezone.utc).replace(tzinfo=None)
 
     # Obtener el usuario
     user = User.query.get(user_id)
     if not user:
         return jsonify({"msg": "User not found."}), 404
 
-    # Reglas de fraude
-    fraud = False
-
-    # 1) High Deviation from Average Spending - últimos 90 días
-    ninety_days_ago = tx_time - timedelta(days=90)
-    recent_transactions = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.timestamp >= ninety_days_ago,
-        Transaction.timestamp < tx_time
-    ).all()
-
-    amounts_90_days = [t.amount for t in recent_transactions]
-    if amounts_90_days:
-        daily_average_90, std_dev_90 = daily_average_and_std(
-            amounts_90_days, recent_transactions, ref_time=tx_time
-        )
-        if std_dev_90 > 0 and amount > (daily_average_90 + 3 * std_dev_90):
-            fraud = True
-    else:
-        # Si no hay historial, no se marca fraude por este punto.
-        daily_average_90 = amount
-        std_dev_90 = 0
-
-    # 2) Unusual Spending Category - últimos 6 meses
-    six_months_ago = tx_time - timedelta(days=180)
-    category_transactions_6m = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.timestamp >= six_months_ago,
-        Transaction.timestamp < tx_time
-    ).all()
-
-    used_categories = {t.category for t in category_transactions_6m}
-    if category not in used_categories and len(category_transactions_6m) > 0:
-        fraud = True
-
-    # 3) Rapid Transactions - más de 3 transacciones en 5 min con sumatoria mayor que daily_average_90
-    five_minutes_ago = tx_time - timedelta(minutes=5)
-    recent_5min_transactions = Transaction.query.filter(
-        Transaction.user_id == user_id,
-        Transaction.timestamp >= five_minutes_ago,
-        Transaction.timestamp < tx_time
-    ).all()
-
-    recent_5min_count = len(recent_5min_transactions) + 1
-    recent_5min_sum = sum(
-        [t.amount for t in recent_5min_transactions]) + amount
-
-    if recent_5min_count > 3 and recent_5min_sum > daily_average_90:
-        fraud = True
+    # Reglas de fraude a partir del estado incremental del usuario
+    fraud = check_fraud(user_id, amount, category, tx_time)
 
     # Crear la transacción
     new_tx = Transaction(
@@ -131,9 +91,11 @@ def add_transaction():
 
     # Actualizar balance del usuario (asumiendo que amount es un gasto)
     user.balance = (user.balance or 0) - amount
+
+    # Las alertas se evalúan y envían en segundo plano (flask alerts-worker)
+    enqueue_alert_check(user.id)
     db.session.commit()
 
-    check_and_notify_alerts(user, new_tx)
     return jsonify({
         "msg": "Transaction added and evaluated for fraud.",
         "data": {
@@ -147,16 +109,114 @@ def add_transaction():
     }), 201
 
 
-def daily_average_and_std(amounts, transactions, ref_time):
-    if not transactions:
-        return 0, 0
-    start_date = min(t.timestamp for t in transactions)
-    days = max((ref_time - start_date).days, 1)
-    total_spent = sum(amounts)
-    daily_avg = total_spent / days
+def parse_batch_row(data, default_user_id):
+    """Valida una fila del lote con las mismas reglas que add_transaction. Devuelve (fila, error)."""
+    error_msg, error_flag = validate_non_empty_fields(data, ["amount", "category"])
+    if error_flag:
+        return None, error_msg
 
-    if len(amounts) > 1:
-        std_dev = statistics.pstdev(amounts)
+    try:
+        amount = float(data["amount"])
+    except (TypeError, ValueError):
+        return None, "Amount must be a number."
+
+    try:
+        user_id = int(data.get("user_id") or default_user_id)
+    except (TypeError, ValueError):
+        return None, "Invalid user_id."
+
+    timestamp_str = data.get("timestamp", None)
+    if timestamp_str is None or str(timestamp_str).strip() == "":
+        tx_time = datetime.utcnow()
     else:
-        std_dev = 0
-    return daily_avg, std_dev
+        try:
+            tx_time = datetime.fromisoformat(str(timestamp_str).replace("Z", "+00:00"))
+        except ValueError:
+            return None, "Invalid timestamp format."
+        if tx_time.tzinfo is not None:
+            tx_time = tx_time.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return {
+        "user_id": user_id,
+        "amount": amount,
+        "category": str(data["category"]).strip().lower(),
+        "timestamp": tx_time,
+    }, None
+
+
+def read_batch(stream, mimetype):
+    """Lee el cuerpo como CSV (con cabecera) o NDJSON sin cargarlo entero. Produce (línea, datos)."""
+    lines = codecs.iterdecode(stream, "utf-8")
+    if mimetype == "text/csv":
+        reader = csv.DictReader(lines)
+        for data in reader:
+            yield reader.line_num, data
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError:
+            data = None
+        yield line_number, data if isinstance(data, dict) else None
+
+
+@transactions_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def add_transactions_batch():
+    """
+    Ingesta masiva de transacciones en NDJSON (una transacción por línea) o CSV (Content-Type: text/csv).
+    Campos por fila: amount, category, timestamp (opcional) y user_id (opcional, por defecto el del token).
+    Las transacciones se evalúan con las mismas reglas de fraude que add_transaction, como si se
+    hubieran enviado una a una en orden cronológico.
+    """
+    identity = get_jwt_identity()
+    if not identity:
+        return jsonify({"msg": "Invalid token."}), 401
+    identity = int(identity)
+    is_processor = identity in current_app.config["BATCH_PROCESSOR_USER_IDS"]
+    max_rows = current_app.config["BATCH_MAX_ROWS"]
+
+    rows = []
+    lines = []
+    rejected = []
+    for line_number, data in read_batch(request.stream, request.mimetype):
+        if data is None:
+            rejected.append({"line": line_number, "msg": "Invalid JSON line."})
+            continue
+        row, error_msg = parse_batch_row(data, identity)
+        if error_msg is None and row["user_id"] != identity and not is_processor:
+            error_msg = "Not allowed to add transactions for other users."
+        if error_msg:
+            rejected.append({"line": line_number, "msg": error_msg})
+            continue
+        if len(rows) >= max_rows:
+            return jsonify({"msg": f"Batch too large, maximum {max_rows} transactions."}), 413
+        rows.append(row)
+        lines.append(line_number)
+
+    # Usuarios inexistentes, con una sola consulta
+    user_ids = {row["user_id"] for row in rows}
+    existing = {user_id for user_id, in db.session.query(User.id).filter(User.id.in_(user_ids))} if user_ids else set()
+    valid = []
+    for line_number, row in zip(lines, rows):
+        if row["user_id"] in existing:
+            valid.append(row)
+        else:
+            rejected.append({"line": line_number, "msg": "User not found."})
+
+    if not valid:
+        return jsonify({"msg": "No valid transactions.", "data": {"rejected": rejected}}), 400
+
+    flags = ingest(valid)
+
+    return jsonify({
+        "msg": "Transactions added and evaluated for fraud.",
+        "data": {
+            "accepted": len(valid),
+            "fraud": sum(flags),
+            "rejected": sorted(rejected, key=lambda r: r["line"])
+        }
+    }), 201
@@ -0,0 +1,155 @@
+from ..config import Config
+from ..extensions import db
+from ..models import Transaction
+from .fraud_batch import DEFAULT_RULES, score_sorted, to_epoch_us
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import csv
+import numpy as np
+
+# Nombre de cada parámetro en la línea de comandos y cómo se traduce a las reglas
+PARAMETERS = {
+    "sigma": ("sigma", float),
+    "average_days": ("average_window", lambda value: timedelta(days=float(value))),
+    "category_days": ("category_window", lambda value: timedelta(days=float(value))),
+    "rapid_minutes": ("rapid_window", lambda value: timedelta(minutes=float(value))),
+    "rapid_count": ("rapid_count", int),
+}
+
+
+def parse_rules(spec):
+    """Convierte 'sigma=2.5,rapid_count=4' en un juego de reglas; lo no indicado toma el valor por defecto."""
+    rules = dict(DEFAULT_RULES)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        if name not in PARAMETERS:
+            raise ValueError(f"Unknown parameter '{name}', expected any of {', '.join(PARAMETERS)}")
+        key, convert = PARAMETERS[name]
+        rules[key] = convert(value)
+    return rules
+
+
+def _empty_counts(rule_sets):
+    return [{"tp": 0, "fp": 0, "fn": 0, "tn": 0} for _ in rule_sets]
+
+
+def score_history(amounts, categories, timestamps, stored, rule_sets, counts):
+    """
+    Reproduce las reglas sobre el historial completo de un usuario (ordenado por timestamp):
+    cada transacción se evalúa frente a las anteriores, como en add_transaction, y se acumula
+    la matriz de confusión respecto al fraude guardado para cada juego de reglas.
+    """
+    codes = {}
+    category_codes = np.array([codes.setdefault(category, len(codes)) for category in categories], dtype=np.int64)
+    ts = to_epoch_us(timestamps)
+    amounts = np.array(amounts, dtype=np.float64)
+    stored = np.array(stored, dtype=bool)
+    targets = np.arange(len(ts))
+
+    for rules, count in zip(rule_sets, counts):
+        predicted = score_sorted(ts, amounts, category_codes, targets, rules)
+        count["tp"] += int(np.count_nonzero(predicted & stored))
+        count["fp"] += int(np.count_nonzero(predicted & ~stored))
+        count["fn"] += int(np.count_nonzero(~predicted & stored))
+        count["tn"] += int(np.count_nonzero(~predicted & ~stored))
+
+
+def _iter_users(rows):
+    """Agrupa filas (user_id, amount, category, timestamp, fraud) ordenadas por usuario."""
+    current = None
+    history = ([], [], [], [])
+    for user_id, amount, category, timestamp, fraud in rows:
+        if user_id != current:
+            if current is not None:
+                yield history
+            current = user_id
+            history = ([], [], [], [])
+        history[0].append(amount)
+        history[1].append(category)
+        history[2].append(timestamp)
+        history[3].append(bool(fraud))
+    if current is not None:
+        yield history
+
+
+def _database_rows(shard, shards, chunk_size):
+    query = db.session.query(
+        Transaction.user_id, Transaction.amount, Transaction.category, Transaction.timestamp, Transaction.fraud
+    ).order_by(Transaction.user_id, Transaction.timestamp, Transaction.id)
+    if shards > 1:
+        query = query.filter(Transaction.user_id % shards == shard)
+    # Cursor de servidor: las filas llegan por bloques en lugar de cargarse todas en memoria
+    return query.execution_options(stream_results=True, yield_per=chunk_size)
+
+
+def _csv_rows(path, shard, shards):
+    # El fichero debe estar ordenado por user_id y timestamp
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            user_id = int(row["user_id"])
+            if shards > 1 and user_id % shards != shard:
+                continue
+            yield (
+                user_id,
+                float(row["amount"]),
+                row["category"],
+                datetime.fromisoformat(row["timestamp"]),
+                row["fraud"].strip().lower() in ("1", "true"),
+            )
+
+
+def run_shard(shard, shards, rule_sets, path=None, chunk_size=10000, database_uri=None):
+    """
+    Backtest de los usuarios del shard. Sin `path` lee la tabla Transaction de `database_uri`
+    (por defecto la de Config): el proceso crea su propia aplicación y no hereda la del llamante.
+    """
+    counts = _empty_counts(rule_sets)
+    if path:
+        rows = _csv_rows(path, shard, shards)
+        for history in _iter_users(rows):
+            score_history(*history, rule_sets, counts)
+        return counts
+
+    from .. import create_app
+    config = Config
+    if database_uri:
+        config = type("BacktestConfig", (Config,), {"SQLALCHEMY_DATABASE_URI": database_uri})
+    with create_app(config).app_context():
+        for history in _iter_users(_database_rows(shard, shards, chunk_size)):
+            score_history(*history, rule_sets, counts)
+    return counts
+
+
+def backtest(rule_sets, path=None, workers=1, chunk_size=10000, database_uri=None):
+    """
+    Ejecuta todos los juegos de reglas en una sola pasada sobre el historial, repartiendo los usuarios
+    en `workers` shards (user_id % workers), cada uno en su propio proceso. La memoria de cada
+    proceso está acotada por el historial del usuario más grande y el tamaño de bloque.
+    Sin `path` cada proceso lee la tabla de transacciones de `database_uri`.
+    Devuelve por juego de reglas la matriz de confusión, la tasa de marcado, la precisión y el recall.
+    """
+    totals = _empty_counts(rule_sets)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_shard, shard, workers, rule_sets, path, chunk_size, database_uri)
+            for shard in range(workers)
+        ]
+        for future in futures:
+            for total, count in zip(totals, future.result()):
+                for key in total:
+                    total[key] += count[key]
+
+    report = []
+    for rules, total in zip(rule_sets, totals):
+        rows = sum(total.values())
+        flagged = total["tp"] + total["fp"]
+        actual = total["tp"] + total["fn"]
+        report.append(dict(
+            total,
+            rules=rules,
+            rows=rows,
+            flag_rate=flagged / rows if rows else 0.0,
+            precision=total["tp"] / flagged if flagged else 0.0,
+            recall=total["tp"] / actual if actual else 0.0,
+        ))
+    return report
@@ -0,0 +1,293 @@
+from ..extensions import db
+from ..models import Transaction, FraudState, FraudDailyBucket, FraudCategorySeen
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+import math
+import statistics
+
+# Ventanas de las reglas de fraude
+AVERAGE_WINDOW = timedelta(days=90)      # 1) Desviación respecto al gasto medio
+CATEGORY_WINDOW = timedelta(days=180)    # 2) Categoría inusual
+RAPID_WINDOW = timedelta(minutes=5)      # 3) Transacciones rápidas
+
+# Transacciones recientes guardadas en el búfer circular del estado
+RECENT_SIZE = 8
+
+# Varianzas relativas por debajo de este valor son ruido de coma flotante al combinar agregados
+VARIANCE_EPSILON = 1e-12
+
+
+def load_history(user_id, tx_time):
+    """
+    Lee en una sola consulta las columnas necesarias (amount, category, timestamp) de las
+    transacciones del usuario en la ventana más amplia (180 días) anterior a tx_time.
+    Usa el índice compuesto (user_id, timestamp) y no construye objetos del ORM.
+    """
+    return db.session.query(
+        Transaction.amount, Transaction.category, Transaction.timestamp
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.timestamp >= tx_time - CATEGORY_WINDOW,
+        Transaction.timestamp < tx_time
+    ).all()
+
+
+def extract_features(history, category, tx_time):
+    """Calcula a partir del historial de 180 días todas las entradas de las tres reglas."""
+    ninety_days_ago = tx_time - AVERAGE_WINDOW
+    five_minutes_ago = tx_time - RAPID_WINDOW
+
+    amounts_90_days = []
+    first_timestamp_90 = None
+    categories_6m = set()
+    count_5min = 0
+    sum_5min = 0
+    for amount, tx_category, timestamp in history:
+        categories_6m.add(tx_category)
+        if timestamp >= ninety_days_ago:
+            amounts_90_days.append(amount)
+            if first_timestamp_90 is None or timestamp < first_timestamp_90:
+                first_timestamp_90 = timestamp
+        if timestamp >= five_minutes_ago:
+            count_5min += 1
+            sum_5min += amount
+
+    return {
+        "count_90": len(amounts_90_days),
+        "sum_90": sum(amounts_90_days),
+        "std_dev_90": statistics.pstdev(amounts_90_days) if len(amounts_90_days) > 1 else 0,
+        "first_timestamp_90": first_timestamp_90,
+        "category_seen": category in categories_6m,
+        "has_history_6m": len(history) > 0,
+        "count_5min": count_5min,
+        "sum_5min": sum_5min,
+    }
+
+
+def evaluate_fraud(features, amount, tx_time):
+    """Aplica las reglas de fraude a una transacción nueva. Devuelve True si se marca como fraude."""
+    fraud = False
+
+    # 1) High Deviation from Average Spending - últimos 90 días
+    if features["count_90"]:
+        days = max((tx_time - features["first_timestamp_90"]).days, 1)
+        daily_average_90 = features["sum_90"] / days
+        std_dev_90 = features["std_dev_90"]
+        if std_dev_90 > 0 and amount > (daily_average_90 + 3 * std_dev_90):
+            fraud = True
+    else:
+        # Si no hay historial, no se marca fraude por este punto.
+        daily_average_90 = amount
+
+    # 2) Unusual Spending Category - últimos 6 meses
+    if not features["category_seen"] and features["has_history_6m"]:
+        fraud = True
+
+    # 3) Rapid Transactions - más de 3 transacciones en 5 min con sumatoria mayor que daily_average_90
+    recent_5min_count = features["count_5min"] + 1
+    recent_5min_sum = features["sum_5min"] + amount
+    if recent_5min_count > 3 and recent_5min_sum > daily_average_90:
+        fraud = True
+
+    return fraud
+
+
+def incremental_features(state, user_id, category, tx_time):
+    """
+    Obtiene las entradas de las reglas a partir del estado incremental, sin recorrer el historial:
+    - 90 días: agregados diarios completos más una consulta acotada al día frontera de la ventana.
+    - 180 días: última vez vista la categoría y última transacción del usuario.
+    - 5 minutos: búfer circular, o una consulta acotada a 5 minutos si el búfer puede haberse quedado corto.
+    Requiere que tx_time sea posterior a todas las transacciones ya registradas en el estado.
+    """
+    window_start = tx_time - AVERAGE_WINDOW
+    boundary_day = window_start.date()
+    boundary_end = datetime.combine(boundary_day + timedelta(days=1), datetime.min.time())
+
+    # Parte de la ventana dentro del día frontera: exacta, desde las transacciones
+    partial = db.session.query(Transaction.amount, Transaction.timestamp).filter(
+        Transaction.user_id == user_id,
+        Transaction.timestamp >= window_start,
+        Transaction.timestamp < min(boundary_end, tx_time)
+    ).all()
+    aggregates = [_bucket_from_rows(partial)] if partial else []
+    aggregates += FraudDailyBucket.query.filter(
+        FraudDailyBucket.user_id == user_id,
+        FraudDailyBucket.day > boundary_day,
+        FraudDailyBucket.day <= tx_time.date()
+    ).all()
+    count_90, sum_90, std_dev_90, first_timestamp_90 = _combine(aggregates)
+
+    seen = db.session.get(FraudCategorySeen, (user_id, category))
+
+    five_minutes_ago = tx_time - RAPID_WINDOW
+    recent = [(datetime.fromisoformat(ts), value) for ts, value in state.recent or []]
+    in_window = [value for ts, value in recent if ts >= five_minutes_ago]
+    if len(recent) >= RECENT_SIZE and len(in_window) == len(recent):
+        # El búfer está lleno de transacciones de la ventana: puede haber más, se consultan
+        in_window = [value for value, in db.session.query(Transaction.amount).filter(
+            Transaction.user_id == user_id,
+            Transaction.timestamp >= five_minutes_ago,
+            Transaction.timestamp < tx_time
+        ).all()]
+
+    return {
+        "count_90": count_90,
+        "sum_90": sum_90,
+        "std_dev_90": std_dev_90,
+        "first_timestamp_90": first_timestamp_90,
+        "category_seen": seen is not None and seen.last_seen >= tx_time - CATEGORY_WINDOW,
+        "has_history_6m": state.last_timestamp >= tx_time - CATEGORY_WINDOW,
+        "count_5min": len(in_window),
+        "sum_5min": sum(in_window),
+    }
+
+
+def _bucket_from_rows(rows):
+    bucket = FraudDailyBucket(count=0, mean=0.0, m2=0.0, total=0.0)
+    for amount, timestamp in rows:
+        _add_to_bucket(bucket, amount, timestamp)
+    return bucket
+
+
+def _add_to_bucket(bucket, amount, timestamp):
+    # Actualización de Welford
+    bucket.count += 1
+    delta = amount - bucket.mean
+    bucket.mean += delta / bucket.count
+    bucket.m2 += delta * (amount - bucket.mean)
+    bucket.total += amount
+    if bucket.first_timestamp is None or timestamp < bucket.first_timestamp:
+        bucket.first_timestamp = timestamp
+
+
+def _combine(buckets):
+    """Combina agregados (Chan et al.) y devuelve (count, suma, desviación típica poblacional, primer timestamp)."""
+    count = sum(b.count for b in buckets)
+    if not count:
+        return 0, 0, 0, None
+
+    total = sum(b.total for b in buckets)
+    mean = sum(b.mean * b.count for b in buckets) / count
+    m2 = sum(b.m2 + b.count * (b.mean - mean) ** 2 for b in buckets)
+    variance = m2 / count if count > 1 else 0
+    if variance <= VARIANCE_EPSILON * mean * mean:
+        variance = 0
+    first_timestamp = min(b.first_timestamp for b in buckets if b.first_timestamp is not None)
+    return count, total, math.sqrt(variance), first_timestamp
+
+
+def rebuild_state(user_id, since):
+    """Reconstruye el estado incremental del usuario a partir de sus transacciones desde `since`."""
+    FraudDailyBucket.query.filter_by(user_id=user_id).delete()
+    FraudCategorySeen.query.filter_by(user_id=user_id).delete()
+    state = db.session.get(FraudState, user_id)
+    if state is None:
+        state = FraudState(user_id=user_id)
+        db.session.add(state)
+    state.first_seen = None
+    state.last_timestamp = None
+    state.recent = []
+
+    rows = db.session.query(
+        Transaction.amount, Transaction.category, Transaction.timestamp
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.timestamp >= since
+    ).order_by(Transaction.timestamp).all()
+
+    buckets = {}
+    categories = {}
+    for amount, category, timestamp in rows:
+        bucket = buckets.get(timestamp.date())
+        if bucket is None:
+            bucket = buckets[timestamp.date()] = FraudDailyBucket(
+                user_id=user_id, day=timestamp.date(), count=0, mean=0.0, m2=0.0, total=0.0
+            )
+        _add_to_bucket(bucket, amount, timestamp)
+        if category is not None:
+            categories[category] = timestamp
+    db.session.add_all(buckets.values())
+    db.session.add_all(
+        FraudCategorySeen(user_id=user_id, category=category, last_seen=last_seen)
+        for category, last_seen in categories.items()
+    )
+
+    if rows:
+        state.first_seen = rows[0].timestamp
+        state.last_timestamp = rows[-1].timestamp
+        state.recent = [[ts.isoformat(), amount] for amount, _, ts in rows[-RECENT_SIZE:]]
+    db.session.flush()
+    return state
+
+
+def update_state(state, amount, category, tx_time):
+    """Incorpora una transacción nueva al estado incremental del usuario."""
+    user_id = state.user_id
+    day = tx_time.date()
+    bucket = db.session.get(FraudDailyBucket, (user_id, day))
+    if bucket is None:
+        bucket = FraudDailyBucket(user_id=user_id, day=day, count=0, mean=0.0, m2=0.0, total=0.0)
+        db.session.add(bucket)
+        # Los agregados que ya no entran en la ventana de 90 días dejan de ser necesarios
+        FraudDailyBucket.query.filter(
+            FraudDailyBucket.user_id == user_id,
+            FraudDailyBucket.day < (tx_time - AVERAGE_WINDOW).date() - timedelta(days=1)
+        ).delete()
+    _add_to_bucket(bucket, amount, tx_time)
+
+    seen = db.session.get(FraudCategorySeen, (user_id, category))
+    if seen is None:
+        db.session.add(FraudCategorySeen(user_id=user_id, category=category, last_seen=tx_time))
+    elif tx_time > seen.last_seen:
+        seen.last_seen = tx_time
+
+    recent = sorted((state.recent or []) + [[tx_time.isoformat(), amount]], key=lambda entry: entry[0])
+    state.recent = recent[-RECENT_SIZE:]
+    if state.first_seen is None or tx_time < state.first_seen:
+        state.first_seen = tx_time
+    if state.last_timestamp is None or tx_time > state.last_timestamp:
+        state.last_timestamp = tx_time
+
+
+def _state_exists(user_id):
+    # Lectura sin bloqueo: un SELECT ... FOR UPDATE sobre una fila inexistente toma un bloqueo de hueco
+    # en InnoDB y dos primeras transacciones concurrentes se interbloquearían al insertar
+    return db.session.query(FraudState.user_id).filter_by(user_id=user_id).first() is not None
+
+
+def lock_state(user_id):
+    """
+    Bloquea (SELECT ... FOR UPDATE) el estado incremental del usuario, creándolo vacío si no existe.
+    Si otra transacción lo crea a la vez, la inserción falla dentro de un savepoint y se bloquea
+    el suyo en cuanto confirma, de modo que las dos primeras transacciones de un usuario se serializan.
+    """
+    if not _state_exists(user_id):
+        try:
+            with db.session.begin_nested():
+                db.session.add(FraudState(user_id=user_id, recent=[]))
+        except IntegrityError:
+            pass
+    return FraudState.query.filter_by(user_id=user_id).with_for_update().populate_existing().one()
+
+
+def check_fraud(user_id, amount, category, tx_time):
+    """
+    Evalúa una transacción nueva y la incorpora al estado incremental del usuario.
+    Con estado válido y transacciones en orden el coste no depende del tamaño del historial;
+    si falta el estado o la transacción llega desordenada se evalúa con el historial completo
+    de 180 días (una sola consulta) y, si hace falta, se reconstruye el estado.
+    """
+    state = lock_state(user_id)
+
+    if state.last_timestamp is not None and tx_time > state.last_timestamp:
+        features = incremental_features(state, user_id, category, tx_time)
+    else:
+        features = extract_features(load_history(user_id, tx_time), category, tx_time)
+        if state.last_timestamp is None:
+            # Estado recién creado (primera transacción o borrado por una ingesta por lotes)
+            rebuild_state(user_id, tx_time - CATEGORY_WINDOW)
+
+    fraud = evaluate_fraud(features, amount, tx_time)
+    update_state(state, amount, category, tx_time)
+    return fraud
@@ -0,0 +1,158 @@
+from ..extensions import db
+from ..models import User, Transaction, FraudState, FraudDailyBucket, FraudCategorySeen
+from .mail import enqueue_alert_check
+from .fraud import AVERAGE_WINDOW, CATEGORY_WINDOW, RAPID_WINDOW, VARIANCE_EPSILON
+from sqlalchemy import bindparam, func, insert, update
+import numpy as np
+
+# Parámetros de las reglas de fraude, iguales a los del endpoint de una transacción
+DEFAULT_RULES = {
+    "sigma": 3,                        # 1) Desviaciones típicas sobre la media diaria
+    "average_window": AVERAGE_WINDOW,  # 1) Ventana de la media y la desviación
+    "category_window": CATEGORY_WINDOW,  # 2) Ventana de categorías conocidas
+    "rapid_window": RAPID_WINDOW,      # 3) Ventana de transacciones rápidas
+    "rapid_count": 3,                  # 3) Transacciones a partir de las cuales se considera ráfaga
+}
+
+MICROSECONDS_PER_DAY = 86400 * 10 ** 6
+
+
+def _microseconds(delta):
+    return int(delta.total_seconds() * 10 ** 6)
+
+
+def to_epoch_us(timestamps):
+    """Convierte datetimes sin zona horaria a un array de microsegundos desde epoch."""
+    return np.array(timestamps, dtype='datetime64[us]').astype(np.int64)
+
+
+def score_sorted(ts, amounts, categories, targets, rules=DEFAULT_RULES):
+    """
+    Evalúa las tres reglas de fraude, vectorizadas, para las posiciones `targets` de las transacciones
+    de un usuario ordenadas por timestamp (`ts` en microsegundos, `categories` como códigos enteros).
+
+    Cada objetivo solo ve las transacciones con timestamp estrictamente anterior al suyo, como si se
+    hubieran enviado una a una en orden cronológico. Las ventanas se resuelven con searchsorted y
+    sumas acumuladas. Devuelve un array booleano con el resultado de cada objetivo.
+    """
+    t = ts[targets]
+    amount = amounts[targets]
+    hi = np.searchsorted(ts, t, side='left')
+
+    # Sumas acumuladas con un 0 inicial; la varianza se calcula sobre importes desplazados para
+    # limitar la cancelación numérica de sum(x^2) - sum(x)^2
+    shift = amounts.mean() if len(amounts) else 0.0
+    shifted = amounts - shift
+    cumsum = np.concatenate(([0.0], np.cumsum(amounts)))
+    cumsum_shifted = np.concatenate(([0.0], np.cumsum(shifted)))
+    cumsum_squares = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+
+    # 1) High Deviation from Average Spending
+    lo = np.searchsorted(ts, t - _microseconds(rules["average_window"]), side='left')
+    count = hi - lo
+    has_average = count > 0
+    safe_count = np.maximum(count, 1)
+    total = cumsum[hi] - cumsum[lo]
+    shifted_mean = (cumsum_shifted[hi] - cumsum_shifted[lo]) / safe_count
+    variance = (cumsum_squares[hi] - cumsum_squares[lo]) / safe_count - shifted_mean ** 2
+    mean = shifted_mean + shift
+    variance = np.where((count > 1) & (variance > VARIANCE_EPSILON * mean * mean), variance, 0.0)
+    std_dev = np.sqrt(variance)
+    first = ts[np.minimum(lo, len(ts) - 1)]
+    days = np.maximum((t - first) // MICROSECONDS_PER_DAY, 1)
+    daily_average = np.where(has_average, total / days, amount)
+    fraud = has_average & (std_dev > 0) & (amount > daily_average + rules["sigma"] * std_dev)
+
+    # 2) Unusual Spending Category: última aparición anterior de la misma categoría
+    lo = np.searchsorted(ts, t - _microseconds(rules["category_window"]), side='left')
+    order = np.lexsort((np.arange(len(categories)), categories))
+    previous = np.full(len(categories), -1, dtype=np.int64)
+    same = categories[order[1:]] == categories[order[:-1]]
+    previous[order[1:][same]] = order[:-1][same]
+    last_seen = previous[targets]
+    pending = last_seen >= hi
+    while pending.any():
+        # Apariciones con el mismo timestamp que el objetivo no cuentan
+        last_seen[pending] = previous[last_seen[pending]]
+        pending = last_seen >= hi
+    fraud |= (last_seen < lo) & (hi > lo)
+
+    # 3) Rapid Transactions
+    lo = np.searchsorted(ts, t - _microseconds(rules["rapid_window"]), side='left')
+    rapid_count = hi - lo + 1
+    rapid_sum = cumsum[hi] - cumsum[lo] + amount
+    fraud |= (rapid_count > rules["rapid_count"]) & (rapid_sum > daily_average)
+
+    return fraud
+
+
+def score_user(history, rows, rules=DEFAULT_RULES):
+    """
+    Evalúa las transacciones nuevas `rows` de un usuario frente a su historial.
+    `history` y `rows` son listas de (amount, category, timestamp). Devuelve una lista de booleanos
+    en el mismo orden que `rows`.
+    """
+    combined = list(history) + list(rows)
+    codes = {}
+    categories = np.array([codes.setdefault(category, len(codes)) for _, category, _ in combined], dtype=np.int64)
+    amounts = np.array([amount for amount, _, _ in combined], dtype=np.float64)
+    ts = to_epoch_us([timestamp for _, _, timestamp in combined])
+
+    # Orden estable: con timestamps iguales, primero el historial y después el orden de llegada
+    order = np.argsort(ts, kind='stable')
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    targets = position[len(history):]
+
+    return score_sorted(ts[order], amounts[order], categories[order], targets, rules).tolist()
+
+
+def ingest(rows):
+    """
+    Evalúa e inserta un lote de transacciones [{user_id, amount, category, timestamp}].
+    Carga la ventana de historial de cada usuario una sola vez, inserta todas las transacciones
+    con un INSERT masivo y actualiza el balance de cada usuario con un solo UPDATE.
+    Devuelve la lista de flags de fraude en el orden de `rows`.
+    """
+    by_user = {}
+    for index, row in enumerate(rows):
+        by_user.setdefault(row["user_id"], []).append(index)
+
+    window = max(DEFAULT_RULES["average_window"], DEFAULT_RULES["category_window"], DEFAULT_RULES["rapid_window"])
+    flags = [False] * len(rows)
+    spent = []
+    for user_id, indexes in by_user.items():
+        user_rows = [(rows[i]["amount"], rows[i]["category"], rows[i]["timestamp"]) for i in indexes]
+        timestamps = [timestamp for _, _, timestamp in user_rows]
+        history = db.session.query(
+            Transaction.amount, Transaction.category, Transaction.timestamp
+        ).filter(
+            Transaction.user_id == user_id,
+            Transaction.timestamp >= min(timestamps) - window,
+            Transaction.timestamp < max(timestamps)
+        ).all()
+
+        for i, fraud in zip(indexes, score_user(history, user_rows)):
+            flags[i] = fraud
+        spent.append({"uid": user_id, "spent": sum(amount for amount, _, _ in user_rows)})
+
+    db.session.execute(insert(Transaction), [dict(row, fraud=fraud) for row, fraud in zip(rows, flags)])
+    users = User.__table__
+    db.session.execute(
+        update(users).where(users.c.id == bindparam("uid")).values(
+            balance=func.coalesce(users.c.balance, 0) - bindparam("spent")
+        ),
+        spent
+    )
+
+    # El estado incremental no incluye estas transacciones: se reconstruirá en la siguiente evaluación
+    user_ids = list(by_user)
+    for model in (FraudState, FraudDailyBucket, FraudCategorySeen):
+        model.query.filter(model.user_id.in_(user_ids)).delete(synchronize_session=False)
+
+    # Las alertas de cada usuario se evalúan una vez, en segundo plano
+    for user_id in user_ids:
+        enqueue_alert_check(user_id)
+
+    db.session.commit()
+    return flags
@@ -1,6 +1,6 @@
 from flask_mail import Message
 from ..extensions import db, mail
-from ..models import User, Alert, Transaction
+from ..models import User, Alert, AlertJob
 from datetime import datetime, timedelta
 
 SAVINGS_ALERT_TEMPLATE = """Dear {user_name},
@@ -22,8 +22,8 @@ The Management Team
 """
 
 
-def send_alert_email(user, alert):
-    """Envía un email al usuario según el tipo de alerta."""
+def build_alert_email(user, alert):
+    """Construye el email de una alerta según su tipo, o None si el tipo no se reconoce."""
     if alert.alert_type == 'amount_reached':
         subject = "Savings Goal Alert"
         body = SAVINGS_ALERT_TEMPLATE.format(
@@ -37,32 +37,122 @@ def send_alert_email(user, alert):
             alert_balance_drop_threshold=alert.balance_drop_threshold
         )
     else:
-        return  # No se reconoce el tipo de alerta, no enviar nada
+        return None  # No se reconoce el tipo de alerta, no enviar nada
 
     msg = Message(subject, recipients=[user.email])
     msg.body = body
-    mail.send(msg)
+    return msg
 
 
-def check_and_notify_alerts(user, last_transaction):
+def alert_triggered(user, alert):
     """
-    Verifica las alertas del usuario y envía notificaciones por email si corresponde.
-    Se asume que:
-    - amount_reached: Se dispara cuando el balance se acerca a target_amount.
-      Por ejemplo, si el balance actual >= (target_amount - alert_threshold).
-    - balance_drop: Se dispara si el balance actual es menor que (target_amount - balance_drop_threshold)
-      o si de alguna forma se detecta una caída significativa.
+    Indica si una alerta se dispara con el balance actual del usuario:
+    - amount_reached: el balance se acerca a target_amount, es decir, balance >= (target_amount - alert_threshold).
+    - balance_drop: el balance cae por debajo de balance_drop_threshold.
     """
-    alerts = Alert.query.filter_by(user_id=user.id).all()
-
-    for alert in alerts:
-        if alert.alert_type == 'amount_reached':
-            # Verificar si el usuario está cerca de la meta
-            if user.balance >= (alert.target_amount - alert.alert_threshold):
-                send_alert_email(user, alert)
-        elif alert.alert_type == 'balance_drop':
-            # Asumiendo que 'balance_drop_threshold' es un valor absoluto por debajo del cual el balance cae
-            # o una cantidad de dinero que indica una caída respecto a un valor anterior.
-            # Ejemplo: si el balance es menor que balance_drop_threshold, enviar alerta.
-            if user.balance < alert.balance_drop_threshold:
-                send_alert_email(user, alert)
+    if alert.alert_type == 'amount_reached':
+        # Verificar si el usuario está cerca de la meta
+        return user.balance >= (alert.target_amount - alert.alert_threshold)
+    if alert.alert_type == 'balance_drop':
+        # Asumiendo que 'balance_drop_threshold' es un valor absoluto por debajo del cual el balance cae
+        return user.balance < alert.balance_drop_threshold
+    return False
+
+
+def enqueue_alert_check(user_id):
+    """
+    Encola la evaluación de las alertas del usuario en la sesión actual, de modo que se confirma
+    en la misma transacción que el movimiento. Si ya hay una evaluación pendiente (aún no reclamada
+    por el worker) no se duplica. La fila pendiente se bloquea hasta el commit: el worker no puede
+    reclamarla mientras tanto, así que siempre evalúa un balance que incluye este movimiento.
+    """
+    pending = db.session.query(AlertJob.id).filter_by(
+        user_id=user_id, status='pending'
+    ).with_for_update().first()
+    if pending is None:
+        db.session.add(AlertJob(user_id=user_id))
+
+
+def claim_alert_jobs(config, now):
+    """
+    Reclama un lote de trabajos vencidos (FOR UPDATE SKIP LOCKED) pasándolos a 'processing' y confirma.
+    A partir de ese momento las transacciones nuevas encolan su propio trabajo en lugar de reutilizarlos.
+    Los trabajos de un worker caído vuelven a poder reclamarse pasado ALERT_CLAIM_TIMEOUT.
+    """
+    jobs = AlertJob.query.filter(
+        AlertJob.status.in_(('pending', 'processing')),
+        AlertJob.next_attempt_at <= now
+    ).order_by(AlertJob.next_attempt_at, AlertJob.id).limit(
+        config['ALERT_JOB_BATCH_SIZE']
+    ).with_for_update(skip_locked=True).all()
+    for job in jobs:
+        job.status = 'processing'
+        job.next_attempt_at = now + timedelta(seconds=config['ALERT_CLAIM_TIMEOUT'])
+    db.session.commit()
+    return jobs
+
+
+def process_alert_jobs(config, now=None):
+    """
+    Procesa un lote de evaluaciones pendientes: reclama los trabajos (claim_alert_jobs),
+    evalúa las alertas de sus usuarios con el balance leído después de reclamarlos y envía
+    todos los emails por una única conexión SMTP.
+    Una alerta no se vuelve a enviar hasta pasado ALERT_COOLDOWN_SECONDS desde su último aviso.
+    Si falla algún envío el trabajo se reintenta con espera exponencial; los avisos ya enviados
+    no se repiten gracias al periodo de espera. Devuelve el número de trabajos procesados.
+    """
+    now = now or datetime.utcnow()
+    jobs = claim_alert_jobs(config, now)
+    if not jobs:
+        return 0
+
+    user_ids = {job.user_id for job in jobs}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+    alerts = {}
+    for alert in Alert.query.filter(Alert.user_id.in_(user_ids)):
+        alerts.setdefault(alert.user_id, []).append(alert)
+
+    cooldown_start = now - timedelta(seconds=config['ALERT_COOLDOWN_SECONDS'])
+    errors = {}
+    pending = []
+    for user_id in user_ids:
+        user = users.get(user_id)
+        if user is None:
+            continue
+        for alert in alerts.get(user_id, []):
+            if alert.last_notified_at is not None and alert.last_notified_at > cooldown_start:
+                continue
+            if alert_triggered(user, alert):
+                msg = build_alert_email(user, alert)
+                if msg is not None:
+                    pending.append((alert, msg))
+
+    if pending:
+        try:
+            with mail.connect() as connection:
+                for alert, msg in pending:
+                    try:
+                        connection.send(msg)
+                    except Exception as e:
+                        errors[alert.user_id] = str(e)
+                        continue
+                    alert.last_notified_at = now
+        except Exception as e:
+            # No se ha podido abrir la conexión con el servidor SMTP
+            for alert, _ in pending:
+                errors.setdefault(alert.user_id, str(e))
+
+    for job in jobs:
+        job.attempts += 1
+        if job.user_id not in errors:
+            job.status = 'done'
+            job.last_error = None
+        elif job.attempts >= config['ALERT_JOB_MAX_ATTEMPTS']:
+            job.status = 'failed'
+            job.last_error = errors[job.user_id]
+        else:
+            job.status = 'pending'
+            job.last_error = errors[job.user_id]
+            job.next_attempt_at = now + timedelta(seconds=config['ALERT_RETRY_BACKOFF'] * 2 ** (job.attempts - 1))
+    db.session.commit()
+    return len(jobs)
@@ -0,0 +1,58 @@
+"""Reglas de fraude tal y como las evaluaba originalmente add_transaction, para comprobar equivalencias."""
+from datetime import datetime, timedelta
+import random
+import statistics
+
+
+def reference_fraud(history, amount, category, tx_time):
+    """Evalúa una transacción frente a `history`, lista de (amount, category, timestamp) de todo el historial."""
+    fraud = False
+
+    # 1) High Deviation from Average Spending - últimos 90 días
+    recent = [(a, t) for a, _, t in history if tx_time - timedelta(days=90) <= t < tx_time]
+    amounts = [a for a, _ in recent]
+    if amounts:
+        days = max((tx_time - min(t for _, t in recent)).days, 1)
+        daily_average = sum(amounts) / days
+        std_dev = statistics.pstdev(amounts) if len(amounts) > 1 else 0
+        if std_dev > 0 and amount > daily_average + 3 * std_dev:
+            fraud = True
+    else:
+        daily_average = amount
+
+    # 2) Unusual Spending Category - últimos 6 meses
+    categories = [c for _, c, t in history if tx_time - timedelta(days=180) <= t < tx_time]
+    if categories and category not in categories:
+        fraud = True
+
+    # 3) Rapid Transactions
+    rapid = [a for a, _, t in history if tx_time - timedelta(minutes=5) <= t < tx_time]
+    if len(rapid) + 1 > 3 and sum(rapid) + amount > daily_average:
+        fraud = True
+
+    return fraud
+
+
+def random_transactions(seed, count, users=5, out_of_order=0.0):
+    """
+    Transacciones aleatorias (user_id, amount, category, timestamp), mayoritariamente en orden
+    cronológico con ráfagas de segundos y saltos de días; una fracción `out_of_order` llega con
+    un timestamp cualquiera dentro de los 300 días del periodo.
+    """
+    rnd = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    clock = start
+    rows = []
+    for _ in range(count):
+        if rnd.random() < out_of_order:
+            timestamp = start + timedelta(seconds=rnd.randint(0, 300 * 86400))
+        else:
+            clock += timedelta(seconds=rnd.choice([5, 30, 600, 3600, 3 * 86400]))
+            timestamp = clock
+        rows.append((
+            rnd.randint(1, users),
+            round(rnd.expovariate(1 / 50), 2),
+            rnd.choice(['food', 'rent', 'travel', 'games', f'misc{rnd.randint(0, 30)}']),
+            timestamp,
+        ))
+    return rows
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+from app.extensions import db, mail
+from app.models import Alert, AlertJob, User
+from app.services.mail import claim_alert_jobs, enqueue_alert_check, process_alert_jobs
+
+NOW = datetime(2024, 1, 1, 12, 0)
+
+
+def add_user_with_alert(balance):
+    user = User(id=1, name='user', email='user@example.com', password_hash='x', balance=balance)
+    db.session.add_all([user, Alert(user_id=1, alert_type='balance_drop', balance_drop_threshold=100)])
+    db.session.commit()
+    return user
+
+
+def queue(user_id):
+    enqueue_alert_check(user_id)
+    db.session.commit()
+
+
+def test_pending_job_is_reused(app):
+    add_user_with_alert(50)
+    queue(1)
+    queue(1)
+
+    assert AlertJob.query.count() == 1
+
+
+def test_transaction_after_claim_queues_a_new_job(app):
+    add_user_with_alert(50)
+    queue(1)
+    [claimed] = claim_alert_jobs(app.config, datetime.utcnow())
+    queue(1)
+
+    assert claimed.status == 'processing'
+    assert AlertJob.query.filter_by(status='pending').count() == 1
+
+
+def test_processing_sends_email_and_marks_job_done(app):
+    add_user_with_alert(50)
+    queue(1)
+
+    with mail.record_messages() as outbox:
+        assert process_alert_jobs(app.config) == 1
+
+    assert [msg.subject for msg in outbox] == ["Balance Drop Alert"]
+    assert AlertJob.query.one().status == 'done'
+    assert Alert.query.one().last_notified_at is not None
+
+
+def test_smtp_failure_sets_job_back_to_pending_with_backoff(app, monkeypatch):
+    add_user_with_alert(50)
+    db.session.add(AlertJob(user_id=1, next_attempt_at=NOW))
+    db.session.commit()
+
+    def refuse():
+        raise ConnectionRefusedError("SMTP down")
+    monkeypatch.setattr(mail, 'connect', refuse)
+    process_alert_jobs(app.config, now=NOW)
+
+    job = AlertJob.query.one()
+    assert (job.status, job.attempts, job.last_error) == ('pending', 1, "SMTP down")
+    assert job.next_attempt_at == NOW + timedelta(seconds=app.config['ALERT_RETRY_BACKOFF'])
+    assert Alert.query.one().last_notified_at is None
@@ -0,0 +1,68 @@
+import csv
+from datetime import timedelta
+import pytest
+from app import create_app
+from app.extensions import db
+from app.models import Transaction, User
+from app.services.backtest import backtest, parse_rules
+from app.services.fraud_batch import DEFAULT_RULES
+from .conftest import TestingConfig
+from .fraud_reference import reference_fraud, random_transactions
+
+
+def test_parse_rules_overrides_only_given_parameters():
+    rules = parse_rules("sigma=2.5, rapid_minutes=10")
+
+    assert rules["sigma"] == 2.5
+    assert rules["rapid_window"] == timedelta(minutes=10)
+    assert rules["rapid_count"] == DEFAULT_RULES["rapid_count"]
+    assert parse_rules("") == DEFAULT_RULES
+
+
+def test_parse_rules_rejects_unknown_parameters():
+    with pytest.raises(ValueError, match="Unknown parameter 'speed'"):
+        parse_rules("speed=3")
+
+
+def labelled_rows():
+    """Transacciones ordenadas por usuario y timestamp con el fraude que marcaban las reglas originales."""
+    rows = sorted(random_transactions(6, 1500, users=4), key=lambda row: (row[0], row[3]))
+    return [
+        (user_id, amount, category, timestamp,
+         reference_fraud([(a, c, t) for u, a, c, t in rows if u == user_id], amount, category, timestamp))
+        for user_id, amount, category, timestamp in rows
+    ]
+
+
+def test_default_rules_reproduce_reference_flags(tmp_path):
+    rows = labelled_rows()
+    path = tmp_path / "history.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["user_id", "amount", "category", "timestamp", "fraud"])
+        for user_id, amount, category, timestamp, fraud in rows:
+            writer.writerow([user_id, amount, category, timestamp.isoformat(), int(fraud)])
+
+    [report] = backtest([DEFAULT_RULES], path=str(path))
+
+    assert (report["fp"], report["fn"]) == (0, 0)
+    assert report["tp"] == sum(row[4] for row in rows) > 0
+    assert report["rows"] == len(rows)
+
+
+def test_shards_read_the_callers_database(tmp_path):
+    database_uri = f"sqlite:///{tmp_path / 'backtest.db'}"
+    rows = labelled_rows()
+    app = create_app(type("BacktestTestingConfig", (TestingConfig,), {"SQLALCHEMY_DATABASE_URI": database_uri}))
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(User(id=i, name=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+                           for i in {row[0] for row in rows})
+        db.session.add_all(Transaction(user_id=u, amount=a, category=c, timestamp=t, fraud=f) for u, a, c, t, f in rows)
+        db.session.commit()
+        db.engine.dispose()
+
+    [report] = backtest([DEFAULT_RULES], workers=2, database_uri=database_uri)
+
+    assert (report["fp"], report["fn"]) == (0, 0)
+    assert report["rows"] == len(rows)
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+import pytest
+from app.extensions import db
+from app.models import FraudState, User, Transaction
+from app.services import fraud
+from app.services.fraud import evaluate_fraud, extract_features, load_history
+from .fraud_reference import reference_fraud, random_transactions
+
+
+def add_users(count):
+    db.session.add_all(User(id=i, name=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+                       for i in range(1, count + 1))
+    db.session.commit()
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_single_scan_matches_reference(app, seed):
+    add_users(5)
+    rows = random_transactions(seed, 1200, out_of_order=0.3)
+    db.session.add_all(Transaction(user_id=u, amount=a, category=c, timestamp=t) for u, a, c, t in rows)
+    db.session.commit()
+
+    histories = {}
+    for user_id, amount, category, timestamp in rows:
+        histories.setdefault(user_id, []).append((amount, category, timestamp))
+
+    for user_id, amount, category, timestamp in rows[::4]:
+        features = extract_features(load_history(user_id, timestamp), category, timestamp)
+        expected = reference_fraud(histories[user_id], amount, category, timestamp)
+        assert evaluate_fraud(features, amount, timestamp) == expected
+
+
+@pytest.mark.parametrize("seed, out_of_order", [(1, 0.0), (2, 0.0), (3, 0.05), (4, 0.3)])
+def test_incremental_state_matches_reference(app, monkeypatch, seed, out_of_order):
+    add_users(5)
+    incremental_calls = []
+    original = fraud.incremental_features
+    monkeypatch.setattr(fraud, "incremental_features", lambda *args: incremental_calls.append(1) or original(*args))
+
+    histories = {}
+    mismatches = []
+    rows = random_transactions(seed, 2400, out_of_order=out_of_order)
+    for index, (user_id, amount, category, timestamp) in enumerate(rows):
+        history = histories.setdefault(user_id, [])
+        expected = reference_fraud(history, amount, category, timestamp)
+        if fraud.check_fraud(user_id, amount, category, timestamp) != expected:
+            mismatches.append(index)
+        db.session.add(Transaction(user_id=user_id, amount=amount, category=category, timestamp=timestamp))
+        db.session.flush()
+        history.append((amount, category, timestamp))
+
+    assert mismatches == []
+    # Con transacciones en orden casi todas se evalúan desde el estado, sin recorrer el historial
+    if out_of_order == 0.0:
+        assert len(incremental_calls) >= len(rows) - 5
+
+
+def test_concurrent_first_transactions_share_the_state(app, monkeypatch):
+    add_users(1)
+    first = datetime(2024, 1, 1, 12, 0)
+    assert fraud.check_fraud(1, 10.0, 'food', first) is False
+    db.session.add(Transaction(user_id=1, amount=10.0, category='food', timestamp=first))
+    db.session.commit()
+
+    # La segunda comprobó que no había estado antes de que la primera confirmara el suyo
+    monkeypatch.setattr(fraud, "_state_exists", lambda user_id: False)
+    assert fraud.check_fraud(1, 20.0, 'food', first + timedelta(minutes=1)) is False
+    db.session.commit()
+
+    state = db.session.get(FraudState, 1)
+    assert state.last_timestamp == first + timedelta(minutes=1)
+    assert len(state.recent) == 2
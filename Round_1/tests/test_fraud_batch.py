@@ -0,0 +1,61 @@
+import json
+import pytest
+from flask_jwt_extended import create_access_token
+from app.extensions import db
+from app.models import AlertJob, Transaction, User
+from app.services.fraud_batch import ingest, score_user
+from .fraud_reference import reference_fraud, random_transactions
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4])
+def test_score_user_matches_reference(seed):
+    rows = [(amount, category, timestamp) for _, amount, category, timestamp in
+            random_transactions(seed, 2400, users=1, out_of_order=0.1)]
+    history, batch = rows[:1200], rows[1200:]
+
+    # Cada fila del lote ve el historial y las filas del lote con timestamp anterior al suyo
+    expected = [reference_fraud(rows, amount, category, timestamp) for amount, category, timestamp in batch]
+    assert score_user(history, batch) == expected
+
+
+def test_ingest_matches_reference_and_updates_balances(app):
+    db.session.add_all(User(id=i, name=f'user{i}', email=f'user{i}@example.com', password_hash='x', balance=1000)
+                       for i in range(1, 4))
+    db.session.commit()
+    rows = [
+        {"user_id": user_id, "amount": amount, "category": category, "timestamp": timestamp}
+        for user_id, amount, category, timestamp in random_transactions(5, 600, users=3, out_of_order=0.2)
+    ]
+
+    flags = ingest(rows)
+
+    for row, flag in zip(rows, flags):
+        history = [(r["amount"], r["category"], r["timestamp"]) for r in rows if r["user_id"] == row["user_id"]]
+        assert flag == reference_fraud(history, row["amount"], row["category"], row["timestamp"])
+    assert Transaction.query.count() == len(rows)
+    for user in User.query:
+        spent = sum(r["amount"] for r in rows if r["user_id"] == user.id)
+        assert user.balance == pytest.approx(1000 - spent)
+    assert sorted(job.user_id for job in AlertJob.query) == [1, 2, 3]
+
+
+def test_batch_endpoint_rejects_rows_for_other_users(app):
+    db.session.add_all([
+        User(id=1, name='one', email='one@example.com', password_hash='x'),
+        User(id=2, name='two', email='two@example.com', password_hash='x'),
+    ])
+    db.session.commit()
+    body = "\n".join(json.dumps(row) for row in [
+        {"amount": 10, "category": "food", "timestamp": "2024-01-01T10:00:00Z"},
+        {"amount": 10, "category": "food", "user_id": 2},
+        {"amount": "ten", "category": "food"},
+    ])
+
+    response = app.test_client().post(
+        '/api/transactions/batch', data=body, content_type='application/x-ndjson',
+        headers={"Authorization": f"Bearer {create_access_token(identity='1')}"}
+    )
+
+    assert response.status_code == 201
+    assert response.json["data"]["accepted"] == 1
+    assert [r["line"] for r in response.json["data"]["rejected"]] == [2, 3]